@@ -0,0 +1,140 @@
+import os
+import logging
+import numpy as np
+
+
+def top_k_indices(scores, top_k):
+    """Return the indices of the top_k highest scores, best first, without a full sort."""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def normalize_rows(vectors):
+    """L2-normalize each row so that dot products become cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def index_path_for(embeddings_path):
+    """ANN index file stored next to the embeddings matrix it was built from."""
+    return f"{os.path.splitext(embeddings_path)[0]}.ivf.npz"
+
+
+class IVFIndex:
+    """Inverted-file ANN index.
+
+    Spherical k-means splits the embedding matrix into `nlist` cells. A query
+    only scores the rows in its `nprobe` closest cells instead of the whole matrix.
+    """
+
+    def __init__(self, centroids, assignments, nprobe=8):
+        self.centroids = normalize_rows(centroids)
+        self.assignments = np.asarray(assignments, dtype=np.int64)
+        self.nprobe = nprobe
+
+        # Row ids grouped by cell so each inverted list is a contiguous slice
+        self.ids = np.argsort(self.assignments, kind="stable")
+        counts = np.bincount(self.assignments, minlength=len(self.centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @property
+    def size(self):
+        return len(self.assignments)
+
+    @classmethod
+    def build(cls, embeddings, nlist=None, nprobe=8, iterations=20, seed=42, batch_size=8192):
+        """Train the coarse quantizer with spherical k-means and assign every row to a cell."""
+        vectors = normalize_rows(embeddings)
+        n = len(vectors)
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        rng = np.random.default_rng(seed)
+        # Train on a sample; 256 points per centroid is plenty for k-means to settle
+        sample_size = min(n, nlist * 256)
+        sample = vectors[rng.choice(n, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            # Re-seed empty cells from random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        assignments = np.empty(n, dtype=np.int64)
+        for start in range(0, n, batch_size):
+            block = vectors[start:start + batch_size]
+            assignments[start:start + batch_size] = np.argmax(block @ centroids.T, axis=1)
+
+        logging.info(f"🧭 Built IVF index: {n} vectors, {nlist} lists")
+        return cls(centroids, assignments, nprobe=nprobe)
+
+    def save(self, path):
+        # Write to a temporary file and rename it, so workers loading the index never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, assignments=self.assignments)
+        os.replace(tmp_path, path)
+        logging.info(f"💾 Saved IVF index to {path}")
+
+    @classmethod
+    def load(cls, path, nprobe=8):
+        data = np.load(path)
+        return cls(data["centroids"], data["assignments"], nprobe=nprobe)
+
+    def search(self, embeddings, query_embedding, top_k, nprobe=None):
+        """Return (indices, scores) of the approximate top_k rows by cosine similarity.
+
+        `embeddings` must already be L2-normalized (see embedding_matrix).
+        """
+        query = normalize_rows(query_embedding.reshape(1, -1))[0]
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+
+        cells = top_k_indices(self.centroids @ query, nprobe)
+        # Sorted row ids keep reads from a memory-mapped matrix sequential
+        candidates = np.sort(np.concatenate([self.ids[self.offsets[c]:self.offsets[c + 1]] for c in cells]))
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = embeddings[candidates].astype(np.float32) @ query
+        best = top_k_indices(scores, top_k)
+        return candidates[best], scores[best]
+
+
+def load_or_build_index(embeddings, embeddings_path, nlist=None, nprobe=8):
+    """Load the IVF index saved next to the matrix, rebuilding it when missing or stale."""
+    path = index_path_for(embeddings_path)
+    stale = (
+        not os.path.exists(path)
+        or os.path.getmtime(path) < os.path.getmtime(embeddings_path)
+    )
+    if not stale:
+        index = IVFIndex.load(path, nprobe=nprobe)
+        if index.size == len(embeddings):
+            logging.info(f"📂 Loaded IVF index from {path}")
+            return index
+        logging.warning(f"IVF index at {path} has {index.size} rows, expected {len(embeddings)}; rebuilding")
+
+    index = IVFIndex.build(embeddings, nlist=nlist, nprobe=nprobe)
+    index.save(path)
+    return index
+
+
+def recall_at_k(approximate_indices, exact_indices):
+    """Fraction of the exact top-k that the approximate search also returned."""
+    if len(exact_indices) == 0:
+        return 1.0
+    return len(set(map(int, approximate_indices)) & set(map(int, exact_indices))) / len(exact_indices)
@@ -1,26 +1,31 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
+from typing import Any, Dict, Optional
 import logging
 import os
+import asyncio
+import functools
+from datetime import datetime, timezone
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_pinecone import PineconeVectorStore
 import warnings
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
+from config import Config
+from query_cache import query_cache
+from semantic_cache import SemanticCache
+from context_assembly import assemble_context
+from context_compression import compress_texts
+from vector_store import create_vector_store
+from encoders import get_encoder, encoder_id, encoder_ready, EncoderEmbeddings
+from rate_limiter import TokenBucketLimiter
+from feedback_writer import FeedbackWriter
 
 # Load environment variables
 load_dotenv()
 
-# Validate required environment variables
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-if not PINECONE_API_KEY:
-    raise ValueError("PINECONE_API_KEY environment variable is required")
-
 # Logging setup
 os.makedirs("logs", exist_ok=True)
 warnings.filterwarnings(
@@ -34,10 +39,14 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[logging.FileHandler("logs/app.log"), logging.StreamHandler()]
 )
-feedback_logger = logging.getLogger("feedback")
-feedback_handler = logging.FileHandler("logs/feedback.log")
-feedback_logger.addHandler(feedback_handler)
-feedback_logger.setLevel(logging.INFO)
+# Feedback is queued and written as JSONL by a background thread, off the request path
+feedback_writer = FeedbackWriter(
+    Config.FEEDBACK_LOG_FILE,
+    max_bytes=Config.FEEDBACK_LOG_MAX_BYTES,
+    backup_count=Config.FEEDBACK_LOG_BACKUPS,
+    batch_size=Config.FEEDBACK_BATCH_SIZE,
+    flush_interval=Config.FEEDBACK_FLUSH_INTERVAL
+)
 
 # FastAPI app
 app = FastAPI(title="Medical RAG API")
@@ -53,28 +62,48 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-# Rate limiter
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Rate limiter: token buckets shared through Redis across workers, in-memory if Redis is unavailable
+limiter = TokenBucketLimiter(Config.RATE_LIMIT, redis_url=Config.RATE_LIMIT_REDIS_URL)
+
+async def enforce_rate_limit(request: Request):
+    client = request.client.host if request.client else "unknown"
+    allowed, retry_after = await limiter.allow(f"chunkapi:{client}")
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded: {Config.RATE_LIMIT}",
+            headers={"Retry-After": str(max(1, round(retry_after)))}
+        )
 
 # Embedding model
 model_name = "pritamdeka/BioBERT-mnli-snli-scinli-scitail-mednli-stsb"
-embedder = HuggingFaceEmbeddings(model_name=model_name)
-
-# Pinecone setup
-os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
-index_name = "medical-rag-index"
+embedder = EncoderEmbeddings(Config.ENCODER_BACKEND, model_name)
+encoder_name = encoder_id(Config.ENCODER_BACKEND, model_name)
 
+# Vector store setup (Pinecone or local, see Config.VECTOR_STORE_BACKEND)
 try:
-    vectorstore = PineconeVectorStore(index_name=index_name, embedding=embedder)
+    vectorstore = create_vector_store(Config.VECTOR_STORE_BACKEND)
 except Exception as e:
-    logging.error(f"Failed to initialize Pinecone vectorstore: {e}")
+    logging.error(f"Failed to initialize {Config.VECTOR_STORE_BACKEND} vectorstore: {e}")
     raise
 
+# Semantic cache: near-duplicate queries reuse the chunks retrieved for an earlier one
+semantic_cache = None
+if Config.SEMANTIC_CACHE_ENABLED:
+    semantic_cache = SemanticCache(
+        Config.EMBEDDING_DIM,
+        threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+        max_entries=Config.SEMANTIC_CACHE_SIZE,
+        ttl_seconds=Config.SEMANTIC_CACHE_TTL_SECONDS
+    )
+
+# Blocking work (BioBERT encodes, vector-store HTTP calls) runs here, never on the event loop
+retrieval_executor = ThreadPoolExecutor(max_workers=Config.RETRIEVAL_POOL_SIZE, thread_name_prefix="retrieval")
+
 # Request models
 class Query(BaseModel):
     text: str
+    filter: Optional[Dict[str, Any]] = None  # chunk fields, e.g. {"entity": "Asthma"}
 
 class Feedback(BaseModel):
     query: str
@@ -82,38 +111,168 @@ class Feedback(BaseModel):
     rating: int
     comment: str = None
 
-# Vector retrieval
-def retrieve_from_vector(query: str, k: int = 3):
+def embed_query(query: str):
+    return query_cache.get_or_encode([query], encoder_name, embedder.embed_documents)[0]
+
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(retrieval_executor, functools.partial(fn, *args, **kwargs))
+
+async def search_with_deadline(search_fn, embedding, k, deadline):
+    """Run a vector-store search off the event loop and return the first successful answer.
+
+    If the first call is still running after RETRIEVAL_HEDGE_AFTER_MS, an identical hedge
+    request is sent. Raises asyncio.TimeoutError once the loop time passes `deadline`.
+    """
+    loop = asyncio.get_running_loop()
+
+    def attempt():
+        return asyncio.ensure_future(run_blocking(search_fn, embedding, k=k))
+
+    pending = {attempt()}
+    hedge_at = loop.time() + Config.RETRIEVAL_HEDGE_AFTER_MS / 1000 if Config.RETRIEVAL_HEDGE_AFTER_MS else None
+    last_error = None
+
+    while pending:
+        wake_at = min(deadline, hedge_at) if hedge_at else deadline
+        done, pending = await asyncio.wait(
+            pending, timeout=max(0, wake_at - loop.time()), return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return task.result()
+            last_error = task.exception()
+
+        if loop.time() >= deadline:
+            for other in pending:
+                other.cancel()
+            raise asyncio.TimeoutError()
+        if hedge_at and loop.time() >= hedge_at and pending:
+            logging.info("⏱️ Vector query is slow, sending a hedged request")
+            pending.add(attempt())
+            hedge_at = None
+
+    raise last_error
+
+def build_context(embedding, documents, vectors=None):
+    """Turn retrieved chunks into prompt context. Returns (text, assembly stats or None)."""
+    if not documents:
+        return "No relevant information found in database.", None
+
+    compress = None
+    if Config.CONTEXT_COMPRESSION:
+        def compress(texts):
+            return compress_texts(embedding, texts, embedder.embed_documents)
+
+    if not Config.CONTEXT_ASSEMBLY:
+        texts = [doc.page_content for doc in documents[:Config.CONTEXT_TOP_K]]
+        return "\n".join(compress(texts) if compress else texts), None
+
+    if vectors is None:
+        vectors = np.asarray(embedder.embed_documents([doc.page_content for doc in documents]))
+    context = assemble_context(embedding, documents, vectors, transform=compress)
+    logging.info(
+        f"🧩 Context: {context['chunks']} chunks, {context['tokens']} tokens "
+        f"({context['tokens_saved']} saved, {context['duplicates_dropped']} near-duplicates dropped)"
+    )
+    return context["text"], context
+
+# HTTP status returned when no retrieval attempt succeeded, so clients see a failure rather than empty context
+RETRIEVAL_ERROR_CODES = {"timeout": 504, "error": 503}
+
+async def rag_query(query, filter=None):
+    """Retrieve context for a query, optionally restricted to chunks matching `filter`.
+
+    Returns (text, status, assembly stats or None); status is "ok", "cached", "timeout" or "error".
+    """
+    embedding = await run_blocking(embed_query, query)
+    version = await run_blocking(vectorstore.current_version)
+    # Cached answers are keyed by embedding alone, so filtered queries bypass the cache
+    cache = semantic_cache if not filter else None
+
+    if cache is not None:
+        cached = cache.lookup(embedding, version)
+        if cached is not None:
+            return cached, "cached", None
+
+    if Config.CONTEXT_ASSEMBLY:
+        # Over-fetch so MMR has alternatives to the near-identical top hits
+        search_fn, k = vectorstore.similarity_search_with_vectors, Config.CONTEXT_FETCH_K
+    else:
+        search_fn, k = vectorstore.similarity_search_by_vector, Config.CONTEXT_TOP_K
+    if filter:
+        search_fn = functools.partial(search_fn, filter=filter)
+
+    loop = asyncio.get_running_loop()
     try:
-        results = vectorstore.similarity_search(query, k=k)
-        return results or []
+        results = await search_with_deadline(search_fn, embedding, k, loop.time() + Config.RETRIEVAL_DEADLINE_MS / 1000)
+    except asyncio.TimeoutError:
+        logging.warning(f"Retrieval deadline of {Config.RETRIEVAL_DEADLINE_MS}ms exceeded for query: {query}")
+        # Another query's cached context is never served in its place: near neighbours can be other drugs or diseases
+        return "Medical reference lookup timed out; no retrieved context is available for this turn.", "timeout", None
     except Exception as e:
         logging.error(f"Retrieval error: {str(e)}")
-        return []
+        return "Medical reference lookup failed; no retrieved context is available for this turn.", "error", None
+
+    documents, vectors = results if Config.CONTEXT_ASSEMBLY else (results, None)
+    text, context = await run_blocking(build_context, embedding, documents, vectors)
+    if documents and cache is not None:
+        cache.put(embedding, text, version)
+    return text, "ok", context
+
+@app.on_event("startup")
+def load_model():
+    # Load and warm the shared encoder before uvicorn starts accepting requests
+    get_encoder(Config.ENCODER_BACKEND, model_name)
 
-def rag_query(query):
-    results = retrieve_from_vector(query)
-    if not results:
-        return "No relevant information found in database."
-    return "\n".join([res.page_content for res in results])
+@app.on_event("shutdown")
+def save_query_cache():
+    # Forked workers exit without running atexit hooks, so persist the cache here
+    query_cache.save()
+
+@app.on_event("shutdown")
+def close_feedback_writer():
+    # Flush queued feedback records before the worker exits
+    feedback_writer.close()
 
 # Health check endpoint
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    return {
+        "status": "ok" if encoder_ready(Config.ENCODER_BACKEND, model_name) else "loading",
+        "vector_store": vectorstore.name,
+        "query_cache": query_cache.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
+        "rate_limit_backend": limiter.backend,
+        "feedback": feedback_writer.stats()
+    }
 
 # Main POST query API
 @app.post("/chunkapi")
-@limiter.limit("5/minute")
 async def handle_query(request: Request, q: Query):
+    await enforce_rate_limit(request)
     try:
-        response_text = rag_query(q.text)
+        response_text, status, context = await rag_query(q.text, q.filter)
+        if status in RETRIEVAL_ERROR_CODES:
+            logging.warning(f"Retrieval {status} for query: {q.text}")
+            return JSONResponse(
+                status_code=RETRIEVAL_ERROR_CODES[status],
+                content={"error": f"retrieval {status}", "response": response_text},
+                headers={"X-Retrieval-Status": status}
+            )
 
         def stream_response():
             yield response_text
 
-        logging.info(f"Processed query: {q.text}")
-        return StreamingResponse(stream_response(), media_type="text/plain")
+        headers = {"X-Retrieval-Status": status}
+        if context is not None:
+            headers["X-Context-Tokens"] = str(context["tokens"])
+            headers["X-Context-Tokens-Saved"] = str(context["tokens_saved"])
+
+        logging.info(f"Processed query ({status}): {q.text}")
+        return StreamingResponse(stream_response(), media_type="text/plain", headers=headers)
 
     except Exception as e:
         logging.error(f"API error: {str(e)}")
@@ -122,10 +281,13 @@ async def handle_query(request: Request, q: Query):
 # Feedback API
 @app.post("/feedback")
 async def receive_feedback(fb: Feedback):
-    feedback_logger.info(
-        f"Feedback received: Query='{fb.query}', Response='{fb.response}', "
-        f"Rating={fb.rating}, Comment='{fb.comment}'"
-    )
+    feedback_writer.submit({
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "query": fb.query,
+        "response": fb.response,
+        "rating": fb.rating,
+        "comment": fb.comment
+    })
     return {"status": "feedback logged"}
 
 # Run the API when executed directly
@@ -0,0 +1,68 @@
+import re
+import json
+import hashlib
+
+# One JSON object per line in *_chunks.jsonl; `sections` lists every record section a chunk covers
+CHUNK_FIELDS = ("id", "source", "entity", "sections", "token_count", "text")
+METADATA_FIELDS = ("source", "entity", "sections", "token_count")
+# List-valued fields: a filter on them matches when any of the chunk's values is allowed
+LIST_FIELDS = ("sections",)
+
+ENTITY_PATTERN = re.compile(r"^(?:Disease|Drug Name): (.+?)\.(?:\s|$)")
+
+
+def chunk_id(text):
+    """Stable chunk id: sha256 of the chunk text (the id vectors are upserted under)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_chunk(text, source=None, entity=None, sections=None, token_count=None):
+    return {
+        "id": chunk_id(text),
+        "source": source,
+        "entity": entity,
+        "sections": sections,
+        "token_count": token_count,
+        "text": text
+    }
+
+
+def from_legacy(text):
+    """Wrap a bare chunk string from the old JSON-list format; the entity is recovered from its header."""
+    match = ENTITY_PATTERN.match(text)
+    return make_chunk(text, entity=match.group(1) if match else None)
+
+
+def iter_chunks(path):
+    """Stream chunk records from a *_chunks.jsonl file or a legacy JSON list of strings."""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        if head == "[":
+            f.seek(0)
+            for item in json.load(f):
+                yield from_legacy(item) if isinstance(item, str) else item
+            return
+        f.seek(0)
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_chunks(path):
+    return list(iter_chunks(path))
+
+
+def matches(chunk, filters):
+    """True if the chunk satisfies every field filter; a list/tuple/set value means "any of".
+
+    For list fields (e.g. sections) it is enough that one of the chunk's values is allowed.
+    """
+    for field, expected in (filters or {}).items():
+        allowed = expected if isinstance(expected, (list, tuple, set)) else [expected]
+        value = chunk.get(field)
+        values = value if field in LIST_FIELDS and isinstance(value, list) else [value]
+        if not any(v in allowed for v in values):
+            return False
+    return True
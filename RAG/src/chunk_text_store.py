@@ -0,0 +1,137 @@
+import os
+import logging
+import sqlite3
+import argparse
+import threading
+from config import Config
+from chunk_schema import iter_chunks
+
+# SQLite caps bound parameters per statement (999 on older builds)
+QUERY_BATCH = 900
+
+
+class ChunkTextStore:
+    """Chunk texts in SQLite, keyed by chunk id.
+
+    Vector indexes (Pinecone, the local ANN matrix) keep only ids and the
+    small filterable fields; hits are turned back into text here. Chunk ids
+    are sha256 content hashes, so a text is stored once no matter how many
+    chunk files or artifacts refer to it. Only the offline jobs
+    (generate_embeddings, store_in_pinecone) write, and nothing is deleted
+    unless `--prune` is asked for; services open the store with `readonly`,
+    which fails if it does not exist (LocalVectorStore then keeps the texts
+    from its own chunk file). Each thread gets its own connection, and WAL
+    mode lets readers run while a job writes.
+    """
+
+    def __init__(self, path=Config.CHUNK_TEXT_STORE_PATH, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()
+        if readonly:
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    f"Chunk text store {path} not found; "
+                    "run store_in_pinecone or chunk_text_store.py on the synced chunk file"
+                )
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self.conn
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, text TEXT NOT NULL) WITHOUT ROWID")
+        conn.commit()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True)
+            else:
+                conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def _select(self, columns, chunk_ids):
+        for start in range(0, len(chunk_ids), QUERY_BATCH):
+            batch = chunk_ids[start:start + QUERY_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            yield from self.conn.execute(f"SELECT {columns} FROM chunks WHERE id IN ({placeholders})", batch)
+
+    def put_many(self, chunks):
+        """Store (id, text) pairs; ids already present are left as they are."""
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO chunks (id, text) VALUES (?, ?)", chunks)
+
+    def add_chunk_file(self, path, batch_size=10000):
+        """Stream a *_chunks.jsonl (or legacy JSON list) file into the store. Returns the chunks read."""
+        batch, total = [], 0
+        for chunk in iter_chunks(path):
+            batch.append((chunk["id"], chunk["text"]))
+            if len(batch) >= batch_size:
+                self.put_many(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.put_many(batch)
+            total += len(batch)
+        return total
+
+    def get_many(self, chunk_ids):
+        """Texts of `chunk_ids` in order (ids may repeat); None for ids the store does not hold."""
+        texts = dict(self._select("id, text", list(dict.fromkeys(chunk_ids))))
+        return [texts.get(cid) for cid in chunk_ids]
+
+    def missing(self, chunk_ids):
+        """Unique ids (first-seen order) the store holds no text for."""
+        unique = list(dict.fromkeys(chunk_ids))
+        stored = {row[0] for row in self._select("id", unique)}
+        return [cid for cid in unique if cid not in stored]
+
+    def require(self, chunk_ids, what):
+        """Raise ValueError unless every id has a text; services call this at startup."""
+        missing = self.missing(chunk_ids)
+        if missing:
+            raise ValueError(
+                f"Chunk text store {self.path} lacks {len(missing)} of the chunks in {what} (e.g. {missing[0]}); "
+                f"run store_in_pinecone or chunk_text_store.py on the served chunk file"
+            )
+
+    def prune(self, keep_ids):
+        """Delete every text whose id is not in `keep_ids`. Returns the number of rows removed."""
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (id TEXT PRIMARY KEY) WITHOUT ROWID")
+            self.conn.execute("DELETE FROM keep")
+            self.conn.executemany("INSERT OR IGNORE INTO keep (id) VALUES (?)", ((cid,) for cid in keep_ids))
+            removed = self.conn.execute("DELETE FROM chunks WHERE id NOT IN (SELECT id FROM keep)").rowcount
+            self.conn.execute("DELETE FROM keep")
+        return removed
+
+    def get(self, chunk_id):
+        return self.get_many([chunk_id])[0]
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load chunk files into the chunk text store")
+    parser.add_argument("chunks", nargs="+", help="*_chunks.jsonl or legacy chunks.json files")
+    parser.add_argument("--store", default=Config.CHUNK_TEXT_STORE_PATH, help="SQLite chunk text store")
+    parser.add_argument("--prune", action="store_true", help="Drop texts of chunks not in the given files")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    store = ChunkTextStore(args.store)
+    for path in args.chunks:
+        logging.info(f"📝 Added {store.add_chunk_file(path)} chunks from {path}")
+    if args.prune:
+        keep = {chunk["id"] for path in args.chunks for chunk in iter_chunks(path)}
+        logging.info(f"🧹 Pruned {store.prune(keep)} chunk texts")
+    logging.info(f"📚 {store.count()} chunk texts in {args.store}")
+    store.close()
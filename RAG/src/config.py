@@ -9,15 +9,65 @@ class Config:
     CHUNK_API_PORT = 8000
     EMBEDDINGS_API_PORT = 8001
     KNOWLEDGE_GRAPH_API_PORT = 8002
+
+    # Supervisor Settings (main.py): worker processes and torch threads per service.
+    # A thread count of 0 splits the CPU cores evenly across the encoder workers.
+    CHUNK_API_WORKERS = int(os.getenv("CHUNK_API_WORKERS", "1"))
+    EMBEDDINGS_API_WORKERS = int(os.getenv("EMBEDDINGS_API_WORKERS", "1"))
+    KNOWLEDGE_GRAPH_API_WORKERS = int(os.getenv("KNOWLEDGE_GRAPH_API_WORKERS", "1"))
+    CHUNK_API_TORCH_THREADS = int(os.getenv("CHUNK_API_TORCH_THREADS", "0"))
+    EMBEDDINGS_API_TORCH_THREADS = int(os.getenv("EMBEDDINGS_API_TORCH_THREADS", "0"))
+    READINESS_TIMEOUT = 300  # seconds to wait for every service's /health
+    SHUTDOWN_TIMEOUT = 30  # seconds for workers to drain before they are killed
+    WORKER_RESTART_BACKOFF = 1  # seconds before restarting a crashed worker, doubled per fast failure
+    WORKER_RESTART_BACKOFF_MAX = 60
+    WORKER_FAST_FAILURE_SECONDS = 30  # a worker that dies sooner than this counts as a fast failure
+    WORKER_MAX_FAST_FAILURES = 5  # consecutive fast failures of one worker before the supervisor gives up
     
     # Model Settings
     EMBEDDING_MODEL = "pritamdeka/BioBERT-mnli-snli-scinli-scitail-mednli-stsb"
     EMBEDDING_DIM = 768
+    EMBEDDING_MODEL_REVISION = os.getenv("EMBEDDING_MODEL_REVISION")  # hub commit/tag; unset = current main commit
+    ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")  # "torch", "onnx" or "int8"
+    ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", "0"))  # intra-op threads; 0 keeps the library default
     
     # Vector Store Settings
+    VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone")  # "pinecone" or "local"
     PINECONE_INDEX_NAME = "medical-rag-index"
     PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
     
+    VECTOR_STORE_VERSION_CHECK_SECONDS = 60
+    PINECONE_POOL_SIZE = 16  # pooled HTTP connections shared by all requests
+    PINECONE_UPSERT_BATCH = 100
+    PINECONE_SYNC_CONCURRENCY = 8  # upsert/delete batches in flight during store_in_pinecone sync
+    PINECONE_MAX_RETRIES = 5
+    PINECONE_SYNC_STATE = "./RAG/embeddings/pinecone_sync.json"  # model/revision, metadata hashes and served version of the last sync
+
+    # Retrieval Deadlines (chunk API)
+    RETRIEVAL_POOL_SIZE = 16  # threads running blocking vector-store calls off the event loop
+    RETRIEVAL_DEADLINE_MS = 1500  # budget for the vector query once the query is embedded
+    RETRIEVAL_HEDGE_AFTER_MS = 300  # send a second identical query if the first is this slow; 0 disables
+
+    # Semantic Response Cache (chunk API)
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = 0.97  # minimum cosine similarity to reuse a cached answer
+    SEMANTIC_CACHE_SIZE = 2048
+    SEMANTIC_CACHE_TTL_SECONDS = 600
+
+    # Context Assembly (chunk API): MMR re-ranking, near-duplicate removal and a token budget
+    CONTEXT_ASSEMBLY = os.getenv("CONTEXT_ASSEMBLY", "true").lower() == "true"
+    CONTEXT_FETCH_K = 10  # candidates retrieved before re-ranking
+    CONTEXT_TOP_K = 3  # chunks kept in the prompt context
+    CONTEXT_MAX_TOKENS = 1024
+    CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER")  # HF tokenizer of the LLM; defaults to the encoder's
+    MMR_LAMBDA = 0.7  # 1.0 = pure relevance, 0.0 = pure diversity
+    CONTEXT_DUPLICATE_THRESHOLD = 0.95  # cosine similarity above which a chunk counts as a near-duplicate
+
+    # Contextual Compression (chunk API): keep only the query-relevant sentences/sections of each hit
+    CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "false").lower() == "true"
+    COMPRESSION_MIN_SIMILARITY = 0.4
+    COMPRESSION_MIN_SPANS = 2  # best spans always kept per chunk, besides its header
+
     # Neo4j Settings
     NEO4J_URI = os.getenv("NEO4J_URI")
     NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
@@ -25,24 +75,75 @@ class Config:
     
     # File Paths
     DATA_DIR = "./RAG/data"
-    CHUNKS_FILE = "./RAG/chunks/chunks.json"
-    EMBEDDINGS_FILE = "./RAG/embeddings/embeddings.npy"
+    SOURCE_ARRAY_PATH = os.getenv("SOURCE_ARRAY_PATH", "results")  # record array in object dumps (openFDA)
+    RECORD_ID_FIELDS = ("id", "set_id", "name")  # first present field keys a record in the chunk manifest
+    CHUNKS_FILE = "./RAG/chunks/chunks.json"  # *_chunks.jsonl, or a legacy JSON list of strings
+    CHUNK_TEXT_STORE_PATH = "./RAG/chunks/chunk_text.sqlite"  # chunk id -> text; indexes keep only ids
+    CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))  # encoder window, special tokens included
+    NEAR_DUPLICATE_DEDUP = os.getenv("NEAR_DUPLICATE_DEDUP", "true").lower() == "true"  # MinHash/LSH merge
+    NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))  # estimated Jaccard
+    MINHASH_PERMUTATIONS = 128
+    MINHASH_BANDS = 16  # 16 bands x 8 rows: candidates from roughly 0.7 Jaccard upwards
+    SHINGLE_SIZE = 3  # words per shingle
+    EMBEDDINGS_FILE = "./RAG/embeddings/embeddings.npy"  # legacy single matrix, used when there is no LATEST artifact
+    EMBEDDINGS_DIR = "./RAG/embeddings"  # sharded artifacts, with LATEST naming the one to serve
+    EMBEDDING_SHARD_ROWS = 50000
+    EMBEDDING_SHARD_DTYPE = os.getenv("EMBEDDING_SHARD_DTYPE", "float32")  # or "float16"
+    EMBEDDING_STORE_PATH = "./RAG/embeddings/embedding_store.sqlite"  # embeddings keyed by chunk hash + model
+    SNAPSHOT_WATCH_INTERVAL = float(os.getenv("SNAPSHOT_WATCH_INTERVAL", "0"))  # seconds; 0 disables the watcher
+    EMBEDDINGS_DTYPE = os.getenv("EMBEDDINGS_DTYPE", "float32")  # "float16" halves the mapped size
     
-    # Rate Limiting
+    # Rate Limiting (token bucket; shared through Redis when RATE_LIMIT_REDIS_URL is set)
     RATE_LIMIT = "5/minute"
+    RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")  # e.g. redis://localhost:6379/0
+
+    # Feedback Logging
+    FEEDBACK_LOG_FILE = "logs/feedback.jsonl"
+    FEEDBACK_LOG_MAX_BYTES = 10 * 1024 * 1024
+    FEEDBACK_LOG_BACKUPS = 5
+    FEEDBACK_BATCH_SIZE = 100
+    FEEDBACK_FLUSH_INTERVAL = 1.0  # seconds
     
     # Retrieval Settings
     DEFAULT_TOP_K = 3
+
+    # Embedding Search Settings ("exact" or "approximate")
+    SEARCH_MODE = os.getenv("SEARCH_MODE", "exact")
+    ANN_NLIST = None  # None picks 4 * sqrt(N) lists
+    ANN_NPROBE = 8
+
+    # Hybrid Retrieval (BM25 + dense, merged with reciprocal-rank fusion)
+    HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "false").lower() == "true"
+    HYBRID_FETCH_K = 20  # candidates taken from each retriever before fusion
+    RRF_K = 60
+    DENSE_WEIGHT = 1.0
+    LEXICAL_WEIGHT = 1.0
+
+    # Query Encoding Settings
+    ENCODE_BATCH_SIZE = 32
+    ENCODE_MAX_WAIT_MS = 5
+
+    # Corpus Encoding Settings (generate_embeddings)
+    EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))  # encoder processes; 0 = min(4, CPU cores)
+    EMBED_BATCH_SIZE = 64
+    EMBED_SHARD_SIZE = 2048  # chunks per worker task; each finished shard is committed to the store
+    EMBED_PARALLEL_MIN_CHUNKS = 8192  # smaller deltas are encoded in-process, without loading a model per worker
+
+    # Query Embedding Cache
+    QUERY_CACHE_SIZE = 10000
+    QUERY_CACHE_TTL_SECONDS = 24 * 3600
+    QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH")  # e.g. ./RAG/cache/query_embeddings.npz
     
     @classmethod
     def validate(cls):
         """Validate required environment variables"""
         required_vars = {
-            "PINECONE_API_KEY": cls.PINECONE_API_KEY,
             "NEO4J_URI": cls.NEO4J_URI,
             "NEO4J_USERNAME": cls.NEO4J_USERNAME,
             "NEO4J_PASSWORD": cls.NEO4J_PASSWORD,
         }
+        if cls.VECTOR_STORE_BACKEND == "pinecone":
+            required_vars["PINECONE_API_KEY"] = cls.PINECONE_API_KEY
         
         missing_vars = [var for var, value in required_vars.items() if not value]
         if missing_vars:
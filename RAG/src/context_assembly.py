@@ -0,0 +1,103 @@
+import logging
+import threading
+import numpy as np
+from config import Config
+from ann_index import normalize_rows
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """Tokenizer used to measure the context budget: CONTEXT_TOKENIZER if set, else the encoder's own."""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                if Config.CONTEXT_TOKENIZER:
+                    from transformers import AutoTokenizer
+                    _tokenizer = AutoTokenizer.from_pretrained(Config.CONTEXT_TOKENIZER)
+                else:
+                    from encoders import get_encoder
+                    _tokenizer = get_encoder().tokenizer
+                logging.info(f"🔢 Context budget tokenizer: {Config.CONTEXT_TOKENIZER or 'encoder tokenizer'}")
+    return _tokenizer
+
+
+def count_tokens(text):
+    return len(get_tokenizer().encode(text, add_special_tokens=False))
+
+
+def truncate_to_tokens(text, max_tokens):
+    tokenizer = get_tokenizer()
+    ids = tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+    return tokenizer.decode(ids)
+
+
+def mmr_select(query_embedding, candidate_embeddings, k, lambda_mult=0.7, duplicate_threshold=0.95):
+    """Maximal marginal relevance over candidates, skipping near-duplicates of already chosen ones.
+
+    Returns (selected candidate positions in pick order, number of near-duplicates dropped).
+    """
+    query = normalize_rows(np.asarray(query_embedding).reshape(1, -1))[0]
+    candidates = normalize_rows(candidate_embeddings)
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+
+    selected, dropped = [], 0
+    remaining = list(range(len(candidates)))
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        best = remaining.pop(int(np.argmax(scores)))
+        if selected and similarity[best, selected].max() >= duplicate_threshold:
+            dropped += 1
+            continue
+        selected.append(best)
+    return selected, dropped
+
+
+def assemble_context(query_embedding, documents, candidate_embeddings, k=Config.CONTEXT_TOP_K,
+                     max_tokens=Config.CONTEXT_MAX_TOKENS, separator="\n", transform=None):
+    """Pick diverse, non-redundant chunks and fit them into a token budget.
+
+    `documents` are in retrieval order. The baseline for `tokens_saved` is the
+    previous behaviour: the top-k documents joined as they are. `transform`
+    optionally rewrites the selected texts (e.g. compression) before packing.
+    """
+    texts = [doc.page_content for doc in documents]
+    baseline_tokens = count_tokens(separator.join(texts[:k]))
+
+    order, duplicates = mmr_select(
+        query_embedding, candidate_embeddings, k,
+        lambda_mult=Config.MMR_LAMBDA, duplicate_threshold=Config.CONTEXT_DUPLICATE_THRESHOLD
+    )
+
+    selected = [texts[position] for position in order]
+    if transform is not None:
+        selected = transform(selected)
+
+    parts, used = [], 0
+    separator_tokens = count_tokens(separator)
+    for text in selected:
+        cost = count_tokens(text) + (separator_tokens if parts else 0)
+        if used + cost <= max_tokens:
+            parts.append(text)
+            used += cost
+        elif not parts:
+            # Never return an empty context: keep the head of the most relevant chunk
+            parts.append(truncate_to_tokens(text, max_tokens))
+            used = max_tokens
+
+    return {
+        "text": separator.join(parts),
+        "chunks": len(parts),
+        "tokens": used,
+        "baseline_tokens": baseline_tokens,
+        # MMR can pick longer chunks from beyond the top k than the baseline had
+        "tokens_saved": max(0, baseline_tokens - used),
+        "duplicates_dropped": duplicates
+    }
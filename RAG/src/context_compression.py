@@ -0,0 +1,51 @@
+import re
+import numpy as np
+from config import Config
+from ann_index import normalize_rows
+
+# Chunks from generate_chunks are "Label: value." runs; split before every label and between sentences
+SECTION_PATTERN = re.compile(
+    r"\s+(?=(?:Description|Symptoms|Cause|Precautions|Treatment|Drugs|Drug Detail - [^:]{1,80}):)"
+)
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9])")
+
+
+def split_spans(text):
+    """Split a chunk into section/sentence spans; the first span is the entity header."""
+    spans = []
+    for section in SECTION_PATTERN.split(text.strip()):
+        spans.extend(s for s in SENTENCE_PATTERN.split(section) if s.strip())
+    return spans
+
+
+def compress_texts(query_embedding, texts, encode_fn, min_similarity=Config.COMPRESSION_MIN_SIMILARITY,
+                   min_spans=Config.COMPRESSION_MIN_SPANS):
+    """Keep only the spans of each text that are relevant to the query.
+
+    Every span of every text is encoded in a single batched `encode_fn` call.
+    A span survives if its cosine similarity to the query reaches
+    `min_similarity` or it is among the `min_spans` best spans of its text.
+    The header span ("Disease: X." / "Drug Name: X.") is always kept so the
+    entity stays named. Surviving spans keep their original order.
+    """
+    split = [split_spans(text) for text in texts]
+    flat = [span for spans in split for span in spans]
+    if not flat:
+        return list(texts)
+
+    query = normalize_rows(np.asarray(query_embedding).reshape(1, -1))[0]
+    scores = normalize_rows(np.asarray(encode_fn(flat))) @ query
+
+    compressed, offset = [], 0
+    for spans in split:
+        span_scores = scores[offset:offset + len(spans)]
+        offset += len(spans)
+        if len(spans) <= min_spans + 1:
+            compressed.append(" ".join(spans))
+            continue
+
+        body_scores = span_scores[1:]
+        keep = set(np.argsort(-body_scores)[:min_spans].tolist())
+        keep.update(np.flatnonzero(body_scores >= min_similarity).tolist())
+        compressed.append(" ".join([spans[0]] + [spans[i + 1] for i in sorted(keep)]))
+    return compressed
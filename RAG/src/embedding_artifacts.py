@@ -0,0 +1,170 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+import numpy as np
+from config import Config
+
+MANIFEST_NAME = "manifest.json"
+LATEST_POINTER = "LATEST"
+FORMAT_VERSION = 1
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_artifact(path):
+    return path.endswith(MANIFEST_NAME) or os.path.isdir(path)
+
+
+def write_artifact(out_dir, chunk_ids, fetch_rows, model_id, revision, chunks_file, dtype="float32",
+                   shard_rows=50000):
+    """Write embeddings as fixed-size .npy shards plus a manifest, one shard in memory at a time.
+
+    `fetch_rows(ids)` returns the float32 rows of a list of chunk ids, in
+    order. The manifest records the row count, chunk ids and sha256 of every
+    shard together with the model id and the chunk file the rows belong to.
+    Returns the manifest path.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    shards, dim = [], None
+    for number, start in enumerate(range(0, len(chunk_ids), shard_rows)):
+        ids = chunk_ids[start:start + shard_rows]
+        rows = np.asarray(fetch_rows(ids)).astype(dtype)
+        dim = rows.shape[1]
+        name = f"shard_{number:05d}.npy"
+        np.save(os.path.join(out_dir, name), rows)
+        shards.append({"file": name, "rows": len(ids), "sha256": file_sha256(os.path.join(out_dir, name)),
+                       "chunk_ids": ids})
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "created": datetime.now().isoformat(),
+        "model_id": model_id,
+        "revision": revision,
+        "dtype": dtype,
+        "dim": dim,
+        "rows": len(chunk_ids),
+        "shard_rows": shard_rows,
+        "chunks_file": chunks_file,
+        "shards": shards
+    }
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+    logging.info(f"🧱 Wrote {len(chunk_ids)} embeddings in {len(shards)} {dtype} shards to {out_dir}")
+    return path
+
+
+def mark_latest(manifest_path, embed_dir):
+    """Point `embed_dir`/LATEST at an artifact so the upsert job and the services pick it up."""
+    pointer = os.path.join(embed_dir, LATEST_POINTER)
+    tmp_path = f"{pointer}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(os.path.relpath(os.path.dirname(os.path.abspath(manifest_path)), os.path.abspath(embed_dir)))
+    os.replace(tmp_path, pointer)
+
+
+def resolve_latest(embed_dir):
+    """Manifest path of the artifact LATEST points at, or None if there is no pointer."""
+    pointer = os.path.join(embed_dir, LATEST_POINTER)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r", encoding="utf-8") as f:
+        return os.path.join(embed_dir, f.read().strip(), MANIFEST_NAME)
+
+
+class EmbeddingArtifact:
+    """Read side of a sharded embedding artifact; shards are memory-mapped on first access."""
+
+    def __init__(self, path):
+        self.path = os.path.join(path, MANIFEST_NAME) if os.path.isdir(path) else path
+        self.root = os.path.dirname(self.path)
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding artifact format in {self.path}: {self.manifest.get('format')}")
+        self._shards = {}
+
+    @property
+    def rows(self):
+        return self.manifest["rows"]
+
+    @property
+    def dim(self):
+        return self.manifest["dim"]
+
+    @property
+    def model_id(self):
+        return self.manifest["model_id"]
+
+    @property
+    def chunks_file(self):
+        return self.manifest["chunks_file"]
+
+    @property
+    def chunk_ids(self):
+        return [cid for shard in self.manifest["shards"] for cid in shard["chunk_ids"]]
+
+    def shard(self, number, verify=False):
+        if number not in self._shards:
+            entry = self.manifest["shards"][number]
+            path = os.path.join(self.root, entry["file"])
+            if verify and file_sha256(path) != entry["sha256"]:
+                raise ValueError(f"Checksum mismatch for {path}")
+            array = np.load(path, mmap_mode="r")
+            if array.shape != (entry["rows"], self.dim):
+                raise ValueError(f"{path} has shape {array.shape}, manifest says ({entry['rows']}, {self.dim})")
+            self._shards[number] = array
+        return self._shards[number]
+
+    def iter_shards(self, verify=False):
+        """Yield (chunk ids, memory-mapped rows) per shard."""
+        for number, entry in enumerate(self.manifest["shards"]):
+            yield entry["chunk_ids"], self.shard(number, verify=verify)
+
+    def matrix(self):
+        """All rows as one in-memory float32 array (for small corpora and tools)."""
+        if not self.rows:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.concatenate([np.asarray(rows, dtype=np.float32) for _, rows in self.iter_shards()])
+
+    def check_alignment(self, chunk_ids):
+        """Raise ValueError unless the artifact rows are exactly these chunks, in this order."""
+        expected = self.chunk_ids
+        if len(expected) != len(chunk_ids):
+            raise ValueError(f"Mismatch: {len(chunk_ids)} chunks vs {len(expected)} embeddings in {self.path}")
+        for row, (a, b) in enumerate(zip(expected, chunk_ids)):
+            if a != b:
+                raise ValueError(f"Chunk/embedding misalignment at row {row} ({b} vs {a}) in {self.path}")
+
+
+def load_embeddings(path):
+    """Embedding matrix from a single .npy file or a sharded artifact."""
+    if is_artifact(path):
+        return EmbeddingArtifact(path).matrix()
+    return np.load(path)
+
+
+def resolve_artifacts(chunks_path=None, embeddings_path=None, embed_dir=Config.EMBEDDINGS_DIR):
+    """(chunks path, embeddings path) to serve.
+
+    Explicit paths win; otherwise the artifact LATEST points at, whose
+    manifest names its chunk file; otherwise the Config defaults.
+    """
+    if embeddings_path is None:
+        embeddings_path = resolve_latest(embed_dir) or Config.EMBEDDINGS_FILE
+    if os.path.isdir(embeddings_path):
+        embeddings_path = os.path.join(embeddings_path, MANIFEST_NAME)
+    if chunks_path is None:
+        chunks_path = EmbeddingArtifact(embeddings_path).chunks_file if is_artifact(embeddings_path) \
+            else Config.CHUNKS_FILE
+    return chunks_path, embeddings_path
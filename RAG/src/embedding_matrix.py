@@ -0,0 +1,70 @@
+import os
+import logging
+import numpy as np
+from ann_index import normalize_rows
+from embedding_artifacts import EmbeddingArtifact, is_artifact
+
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def normalized_path_for(embeddings_path, dtype="float32"):
+    """Pre-normalized copy of the matrix, stored next to the raw embeddings."""
+    suffix = "f16" if dtype == "float16" else "f32"
+    return f"{os.path.splitext(embeddings_path)[0]}.normalized.{suffix}.npy"
+
+
+def prepare_normalized_matrix(embeddings_path, dtype="float32", block_size=65536):
+    """Write an L2-normalized copy of the matrix block by block, skipping it if already up to date."""
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported embeddings dtype: {dtype} (expected one of {SUPPORTED_DTYPES})")
+
+    path = normalized_path_for(embeddings_path, dtype)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(embeddings_path):
+        return path
+
+    if is_artifact(embeddings_path):
+        # Sharded artifact: stream the shards (checksums verified once, here) into one matrix
+        artifact = EmbeddingArtifact(embeddings_path)
+        shape = (artifact.rows, artifact.dim)
+        shards = (rows for _, rows in artifact.iter_shards(verify=True))
+    else:
+        raw = np.load(embeddings_path, mmap_mode="r")
+        shape = raw.shape
+        shards = [raw]
+
+    # Write to a temp file and rename so other workers never map a half-written matrix
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+    offset = 0
+    for rows in shards:
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            out[offset:offset + len(block)] = normalize_rows(block).astype(dtype)
+            offset += len(block)
+    out.flush()
+    del out
+    os.replace(tmp_path, path)
+
+    logging.info(f"💾 Wrote normalized {dtype} matrix {shape} to {path}")
+    return path
+
+
+def load_normalized_matrix(embeddings_path, dtype="float32"):
+    """Open the pre-normalized matrix read-only with mmap so workers share one page-cache copy."""
+    path = prepare_normalized_matrix(embeddings_path, dtype)
+    matrix = np.load(path, mmap_mode="r")
+    logging.info(f"📂 Memory-mapped {matrix.shape} {matrix.dtype} matrix from {path}")
+    return matrix
+
+
+def cosine_scores(matrix, query_embedding, block_size=65536):
+    """Cosine similarity of a query against a pre-normalized matrix: a single matrix-vector product."""
+    query = normalize_rows(np.asarray(query_embedding).reshape(1, -1))[0]
+    if matrix.dtype == np.float32:
+        return matrix @ query
+
+    # numpy has no BLAS path for float16, so upcast one block at a time
+    scores = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), block_size):
+        scores[start:start + block_size] = matrix[start:start + block_size].astype(np.float32) @ query
+    return scores
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import numpy as np
+
+# SQLite caps bound parameters per statement (999 on older builds)
+QUERY_BATCH = 900
+
+
+class EmbeddingStore:
+    """Content-addressed embedding cache in SQLite.
+
+    Rows are keyed by (chunk id, model id, model revision). The chunk id is
+    the sha256 of the chunk text, so an unchanged chunk is never encoded
+    twice by the same model, and a full matrix for any chunk set can be
+    assembled from stored rows.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   chunk_id TEXT NOT NULL,
+                   model_id TEXT NOT NULL,
+                   revision TEXT NOT NULL,
+                   dim INTEGER NOT NULL,
+                   vector BLOB NOT NULL,
+                   PRIMARY KEY (chunk_id, model_id, revision)
+               ) WITHOUT ROWID"""
+        )
+        self.conn.commit()
+
+    def _select(self, columns, chunk_ids, model_id, revision):
+        for start in range(0, len(chunk_ids), QUERY_BATCH):
+            batch = chunk_ids[start:start + QUERY_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            yield from self.conn.execute(
+                f"SELECT {columns} FROM embeddings "
+                f"WHERE model_id = ? AND revision = ? AND chunk_id IN ({placeholders})",
+                [model_id, revision, *batch]
+            )
+
+    def missing(self, chunk_ids, model_id, revision):
+        """Unique ids (first-seen order) that have no stored embedding for this model and revision."""
+        unique = list(dict.fromkeys(chunk_ids))
+        stored = {row[0] for row in self._select("chunk_id", unique, model_id, revision)}
+        return [cid for cid in unique if cid not in stored]
+
+    def put_many(self, chunk_ids, vectors, model_id, revision):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (chunk_id, model_id, revision, dim, vector) VALUES (?, ?, ?, ?, ?)",
+                [(cid, model_id, revision, vectors.shape[1], vector.tobytes()) for cid, vector in zip(chunk_ids, vectors)]
+            )
+
+    def get_matrix(self, chunk_ids, model_id, revision, out=None):
+        """Stack the stored embeddings of `chunk_ids` in order (ids may repeat).
+
+        `out` may be a preallocated (or memory-mapped) float32 array to fill.
+        Raises KeyError if any id has no stored embedding.
+        """
+        positions = {}
+        for i, cid in enumerate(chunk_ids):
+            positions.setdefault(cid, []).append(i)
+
+        found = 0
+        for cid, dim, blob in self._select("chunk_id, dim, vector", list(positions), model_id, revision):
+            if out is None:
+                out = np.empty((len(chunk_ids), dim), dtype=np.float32)
+            out[positions[cid]] = np.frombuffer(blob, dtype=np.float32)
+            found += 1
+
+        if found < len(positions):
+            raise KeyError(f"{len(positions) - found} chunks have no stored embedding for {model_id}@{revision}")
+        return out if out is not None else np.empty((0, 0), dtype=np.float32)
+
+    def count(self, model_id=None, revision=None):
+        if model_id is None:
+            return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM embeddings WHERE model_id = ? AND revision = ?", (model_id, revision)
+        ).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
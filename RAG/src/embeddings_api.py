@@ -1,56 +1,183 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
-import json
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import Any, Dict, List, Optional
 import logging
 import uvicorn
 import threading
+import time
+from config import Config
+from ann_index import recall_at_k
+from lexical_index import reciprocal_rank_fusion
+from snapshot import SnapshotManager
+from micro_batcher import MicroBatcher
+from query_cache import query_cache
+from encoders import get_encoder, encoder_id, encoder_ready
+from chunk_schema import METADATA_FIELDS
 
 # Logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # Constants
-CHUNKS_PATH = "./RAG/chunks/chunks.json"
-EMBEDDINGS_PATH = "./RAG/embeddings/embeddings.npy"
 MODEL_NAME = 'pritamdeka/BioBERT-mnli-snli-scinli-scitail-mednli-stsb'
+ENCODER_ID = encoder_id(Config.ENCODER_BACKEND, MODEL_NAME)
 
-# Load data once
+# Load data once: pre-normalized, memory-mapped matrix shared by uvicorn workers.
+# The LATEST embedding artifact is served (legacy Config files if there is none);
+# later corpora are swapped in through /embeddapi/reload or the file watcher.
 logging.info("Loading chunks and embeddings...")
-with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
-    chunks = json.load(f)
-embeddings = np.load(EMBEDDINGS_PATH)
+snapshots = SnapshotManager()
+if Config.SNAPSHOT_WATCH_INTERVAL > 0:
+    snapshots.watch(Config.SNAPSHOT_WATCH_INTERVAL)
 
-logging.info("Loading BioBERT model...")
-model = SentenceTransformer(MODEL_NAME)
+# Concurrent requests share forward passes instead of encoding one query at a time.
+# The BioBERT weights come from the process-wide registry shared with chunk_api.
+batcher = MicroBatcher(
+    lambda texts: get_encoder(Config.ENCODER_BACKEND, MODEL_NAME).encode(texts, convert_to_numpy=True),
+    max_batch_size=Config.ENCODE_BATCH_SIZE,
+    max_wait_ms=Config.ENCODE_MAX_WAIT_MS
+)
 
 # FastAPI app
 app = FastAPI(title="Medical Embedding Retrieval API")
 
+@app.on_event("startup")
+def load_model():
+    # Load and warm the shared encoder before uvicorn starts accepting requests
+    logging.info("Loading BioBERT model...")
+    get_encoder(Config.ENCODER_BACKEND, MODEL_NAME)
+
+@app.on_event("shutdown")
+def save_query_cache():
+    # Forked workers exit without running atexit hooks, so persist the cache here
+    query_cache.save()
+
+@app.get("/health")
+def health_check():
+    return {"status": "ok" if encoder_ready(Config.ENCODER_BACKEND, MODEL_NAME) else "loading"}
+
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 2
+    report_recall: bool = False
+    filter: Optional[Dict[str, Any]] = None  # chunk fields, e.g. {"entity": "Asthma", "sections": ["treatment"]}
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 2
+    filter: Optional[Dict[str, Any]] = None
 
-def retrieve_similar_embeddings(query: str, top_k: int = 2):
-    query_embedding = model.encode([query])
-    similarities = cosine_similarity(query_embedding, embeddings)[0]
-    top_k_indices = similarities.argsort()[-top_k:][::-1]
+def encode_queries(queries):
+    return query_cache.get_or_encode(queries, ENCODER_ID, batcher.encode)
 
+def build_results(snapshot, indices, scores):
     results = []
-    for idx in top_k_indices:
+    for idx, score, text in zip(indices, scores, snapshot.store.texts(indices)):
+        record = snapshot.store.records[idx]
         results.append({
-            "score": float(similarities[idx]),
-            "chunk": chunks[idx],
-            "index": int(idx)
+            "score": float(score),
+            "chunk": text,
+            "index": int(idx),
+            "id": record["id"],
+            **{field: record.get(field) for field in METADATA_FIELDS}
         })
-
     return results
 
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 3)
+
+def search(snapshot, query, query_embedding, top_k, filter=None):
+    """Dense search, fused with BM25 via reciprocal-rank fusion when hybrid search is enabled.
+
+    `filter` limits both retrievers to chunks whose metadata fields match.
+    """
+    timings = {}
+    store, lexical_index = snapshot.store, snapshot.lexical_index
+    fetch_k = top_k if lexical_index is None else max(top_k, Config.HYBRID_FETCH_K)
+
+    start = time.perf_counter()
+    indices, scores = store.search(query_embedding, fetch_k, filter=filter)
+    timings["dense_ms"] = elapsed_ms(start)
+    if lexical_index is None:
+        return indices, scores, timings
+
+    start = time.perf_counter()
+    rows = store.filter_rows(filter) if filter else None
+    lexical_indices, _ = lexical_index.search(query, fetch_k, rows=rows)
+    timings["lexical_ms"] = elapsed_ms(start)
+
+    start = time.perf_counter()
+    fused = reciprocal_rank_fusion(
+        [indices, lexical_indices], [Config.DENSE_WEIGHT, Config.LEXICAL_WEIGHT], k=Config.RRF_K
+    )[:top_k]
+    timings["fusion_ms"] = elapsed_ms(start)
+    return [idx for idx, _ in fused], [score for _, score in fused], timings
+
+def search_info(snapshot):
+    info = {"snapshot_version": snapshot.version, "search_mode": snapshot.store.search_mode}
+    if snapshot.lexical_index is not None:
+        info["fusion"] = {
+            "method": "rrf",
+            "rrf_k": Config.RRF_K,
+            "dense_weight": Config.DENSE_WEIGHT,
+            "lexical_weight": Config.LEXICAL_WEIGHT
+        }
+    return info
+
+def retrieve_similar_embeddings(query: str, top_k: int = 2, filter=None):
+    snapshot = snapshots.current
+    query_embedding = encode_queries([query])[0]
+    indices, scores, _ = search(snapshot, query, query_embedding, top_k, filter=filter)
+    return build_results(snapshot, indices, scores)
+
 @app.post("/embeddapi")
 def retrieve(request: QueryRequest):
-    results = retrieve_similar_embeddings(request.query, request.top_k)
-    return {"query": request.query, "results": results}
+    # Pin one snapshot for the whole request so a concurrent reload cannot mix versions
+    snapshot = snapshots.current
+
+    start = time.perf_counter()
+    query_embedding = encode_queries([request.query])[0]
+    encode_ms = elapsed_ms(start)
+
+    indices, scores, timings = search(snapshot, request.query, query_embedding, request.top_k, request.filter)
+    response = {
+        "query": request.query,
+        **search_info(snapshot),
+        "timings_ms": {"encode_ms": encode_ms, **timings},
+        "results": build_results(snapshot, indices, scores)
+    }
+    if request.report_recall:
+        # Recall of the dense retriever against a brute-force scan, for tuning ANN_NPROBE
+        store = snapshot.store
+        dense_indices = indices if snapshot.lexical_index is None else store.search(
+            query_embedding, request.top_k, filter=request.filter
+        )[0]
+        exact_indices, _ = store.exact_search(query_embedding, request.top_k, filter=request.filter)
+        response["recall"] = recall_at_k(dense_indices, exact_indices)
+    return response
+
+@app.post("/embeddapi/batch")
+def retrieve_batch(request: BatchQueryRequest):
+    snapshot = snapshots.current
+    query_embeddings = encode_queries(request.queries)
+    responses = []
+    for query, query_embedding in zip(request.queries, query_embeddings):
+        indices, scores, timings = search(snapshot, query, query_embedding, request.top_k, request.filter)
+        responses.append({"query": query, "timings_ms": timings, "results": build_results(snapshot, indices, scores)})
+    return {**search_info(snapshot), "results": responses}
+
+@app.post("/embeddapi/reload")
+def reload_snapshot():
+    # Only the served artifact (LATEST, or the configured files) is reloaded; callers cannot pick paths
+    started = snapshots.reload()
+    return {"reload_started": started, **snapshots.status()}
+
+@app.get("/embeddapi/snapshot")
+def snapshot_status():
+    return snapshots.status()
+
+@app.get("/embeddapi/cache")
+def cache_stats():
+    return query_cache.stats()
 
 # Function for CLI input
 def cli_input():
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from config import Config
+from chunk_schema import load_chunks
+from embedding_artifacts import load_embeddings, resolve_artifacts
+
+SUPPORTED_BACKENDS = ("torch", "onnx", "int8")
+
+# Process-wide registry: every service in the process shares one copy of the weights
+_encoders = {}
+_warmed = set()
+_registry_lock = threading.Lock()
+
+
+def encoder_id(backend=Config.ENCODER_BACKEND, model_name=Config.EMBEDDING_MODEL):
+    """Identity of an encoder, used to key caches so vectors from different backends never mix."""
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def resolve_revision(model_name=Config.EMBEDDING_MODEL, revision=Config.EMBEDDING_MODEL_REVISION):
+    """Hub commit hash of `revision` (a commit, tag or branch; unset means the default branch).
+
+    The commit is what caches and artifacts are keyed on, so vectors from
+    different snapshots of the model never mix. It is asked from the hub and,
+    offline, read from the local snapshot cache; a local model directory is
+    keyed by a hash of its files' sizes and modification times.
+    """
+    if os.path.isdir(model_name):
+        digest = hashlib.sha256()
+        for root, _, files in sorted(os.walk(model_name)):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                digest.update(f"{os.path.relpath(os.path.join(root, name), model_name)}:{stat.st_size}:"
+                              f"{stat.st_mtime_ns}".encode())
+        return f"local-{digest.hexdigest()[:12]}"
+
+    from huggingface_hub import HfApi, snapshot_download
+
+    try:
+        return HfApi().model_info(model_name, revision=revision).sha
+    except Exception as e:
+        logging.warning(f"Could not ask the hub for {model_name}@{revision or 'main'} ({e}); using the local cache")
+    try:
+        # Snapshots are cached under snapshots/<commit hash>
+        return os.path.basename(snapshot_download(model_name, revision=revision, local_files_only=True))
+    except Exception as e:
+        raise RuntimeError(
+            f"Cannot resolve the revision of {model_name}; set EMBEDDING_MODEL_REVISION to a commit hash"
+        ) from e
+
+
+def load_encoder(backend=Config.ENCODER_BACKEND, model_name=Config.EMBEDDING_MODEL, threads=Config.ENCODER_THREADS,
+                 revision=Config.EMBEDDING_MODEL_REVISION):
+    """Load BioBERT as a SentenceTransformer on CPU with the requested backend.
+
+    - "torch": plain fp32 PyTorch (the original behaviour)
+    - "onnx": exported to ONNX Runtime through optimum
+    - "int8": PyTorch with dynamic int8 quantization of every Linear layer
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {backend} (expected one of {SUPPORTED_BACKENDS})")
+    if threads:
+        torch.set_num_threads(threads)
+
+    logging.info(f"Loading embedding model: {model_name} ({backend} backend)")
+    if backend == "onnx":
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        if threads:
+            session_options.intra_op_num_threads = threads
+        return SentenceTransformer(
+            model_name,
+            device="cpu",
+            revision=revision,
+            backend="onnx",
+            model_kwargs={"provider": "CPUExecutionProvider", "session_options": session_options}
+        )
+
+    model = SentenceTransformer(model_name, device="cpu", revision=revision)
+    if backend == "int8":
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def warm_up(model):
+    """Run a dummy encode so the first real request does not pay for lazy initialisation."""
+    start = time.perf_counter()
+    model.encode(["warm-up query: fever and headache"], convert_to_numpy=True)
+    logging.info(f"🔥 Encoder warmed up in {round(time.perf_counter() - start, 2)}s")
+
+
+def get_encoder(backend=Config.ENCODER_BACKEND, model_name=Config.EMBEDDING_MODEL, warm=True,
+                threads=Config.ENCODER_THREADS):
+    """Shared encoder for this process, loaded on first use and exactly once.
+
+    With warm=True (the default) it is also warmed up before it is returned.
+    The supervisor in main.py preloads with warm=False so forked workers
+    share the weights copy-on-write, and each worker warms up its own
+    thread pool. `threads` only applies when this call loads the encoder.
+    """
+    key = encoder_id(backend, model_name)
+    model = _encoders.get(key)
+    if model is None or (warm and key not in _warmed):
+        with _registry_lock:
+            model = _encoders.get(key)
+            if model is None:
+                model = load_encoder(backend, model_name, threads)
+                _encoders[key] = model
+            if warm and key not in _warmed:
+                warm_up(model)
+                _warmed.add(key)
+    return model
+
+
+def encoder_ready(backend=Config.ENCODER_BACKEND, model_name=Config.EMBEDDING_MODEL):
+    return encoder_id(backend, model_name) in _warmed
+
+
+class EncoderEmbeddings(Embeddings):
+    """LangChain Embeddings adapter over the shared encoder, resolved on first use."""
+
+    def __init__(self, backend=Config.ENCODER_BACKEND, model_name=Config.EMBEDDING_MODEL):
+        self.backend = backend
+        self.model_name = model_name
+
+    @property
+    def model(self):
+        return get_encoder(self.backend, self.model_name)
+
+    def embed_documents(self, texts):
+        return self.model.encode(list(texts), convert_to_numpy=True).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def parity_check(backend, chunks, reference_embeddings, sample_size=256, top_k=10, seed=42):
+    """Compare a backend against fp32 torch on a sample of chunks.
+
+    Reports per-vector cosine agreement, recall@k of retrieval against the
+    stored fp32 matrix, and encode speed of both backends.
+    """
+    from ann_index import normalize_rows, top_k_indices
+
+    rng = np.random.default_rng(seed)
+    sample = [chunks[i] for i in rng.choice(len(chunks), min(sample_size, len(chunks)), replace=False)]
+    matrix = normalize_rows(reference_embeddings)
+
+    report = {"backend": backend, "samples": len(sample)}
+    encoded = {}
+    for name in ("torch", backend):
+        model = load_encoder(name)
+        model.encode(sample[:4])  # Warm-up so lazy initialisation is not timed
+        start = time.perf_counter()
+        encoded[name] = normalize_rows(model.encode(sample, convert_to_numpy=True))
+        report[f"{name}_chunks_per_sec"] = round(len(sample) / (time.perf_counter() - start), 2)
+
+    agreement = np.sum(encoded["torch"] * encoded[backend], axis=1)
+    recalls = []
+    for reference, candidate in zip(encoded["torch"], encoded[backend]):
+        expected = set(top_k_indices(matrix @ reference, top_k).tolist())
+        actual = set(top_k_indices(matrix @ candidate, top_k).tolist())
+        recalls.append(len(expected & actual) / len(expected))
+
+    report.update({
+        "mean_cosine": round(float(agreement.mean()), 5),
+        "min_cosine": round(float(agreement.min()), 5),
+        f"recall_at_{top_k}": round(float(np.mean(recalls)), 4),
+        "speedup": round(report[f"{backend}_chunks_per_sec"] / report["torch_chunks_per_sec"], 2)
+    })
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Check an encoder backend against fp32 BioBERT embeddings")
+    parser.add_argument("--backend", default="onnx", choices=[b for b in SUPPORTED_BACKENDS if b != "torch"])
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    chunks_path, embeddings_path = resolve_artifacts()
+    chunks = [chunk["text"] for chunk in load_chunks(chunks_path)]
+    report = parity_check(args.backend, chunks, load_embeddings(embeddings_path), args.samples, args.top_k)
+    print(json.dumps(report, indent=2))
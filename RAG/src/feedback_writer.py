@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import queue
+import fcntl
+import logging
+import threading
+
+
+class FeedbackWriter:
+    """Queue-backed JSONL writer that keeps disk I/O off the request path.
+
+    Requests only enqueue a record. A background thread writes the records in
+    batches (up to `batch_size`, or whatever arrived within `flush_interval`
+    seconds) with one append per batch, fsyncs, and rotates the file once it
+    grows past `max_bytes`. Rotation holds an flock on a sidecar lock file,
+    and writers reopen the path when its inode changes, so several worker
+    processes can share one file safely.
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=5, batch_size=100,
+                 flush_interval=1.0, max_queue=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._fd = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        """Enqueue a record without blocking; returns False (and counts a drop) if the queue is full."""
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout=5):
+        """Flush everything still queued and stop the writer thread, waiting at most `timeout` seconds."""
+        self._stop.set()
+        try:
+            # Wake the writer if it is idle; a full queue means it is busy and will see the stop flag
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def _open(self):
+        if self._fd is not None:
+            try:
+                if os.fstat(self._fd).st_ino == os.stat(self.path).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            os.close(self._fd)
+        # O_APPEND makes each batch write land at the end even with several writers
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def _rotate_if_needed(self):
+        if os.fstat(self._fd).st_size < self.max_bytes:
+            return
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have rotated while we waited for the lock
+            if os.path.exists(self.path) and os.stat(self.path).st_size >= self.max_bytes:
+                for i in range(self.backup_count - 1, 0, -1):
+                    if os.path.exists(f"{self.path}.{i}"):
+                        os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+                os.replace(self.path, f"{self.path}.1")
+            fcntl.flock(lock, fcntl.LOCK_UN)
+        self._open()
+
+    def _write(self, batch):
+        payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch).encode("utf-8")
+        self._open()
+        os.write(self._fd, payload)
+        os.fsync(self._fd)
+        self.written += len(batch)
+        self._rotate_if_needed()
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+                deadline = time.monotonic() + self.flush_interval
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                pass
+
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    logging.error(f"❌ Failed to write {len(batch)} feedback records: {e}")
+            # Keep draining after close() until the queue is empty
+            if self._stop.is_set() and self._queue.empty():
+                break
+        if self._fd is not None:
+            os.close(self._fd)
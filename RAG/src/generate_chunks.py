@@ -1,9 +1,18 @@
 import json
 import os
 import logging
+import re
 import hashlib
+import argparse
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime
+from config import Config
+from chunk_schema import make_chunk, iter_chunks, CHUNK_FIELDS
+from source_reader import iter_records, list_sources
+from near_duplicates import MinHasher, NearDuplicateIndex
 
 load_dotenv()
 
@@ -14,93 +23,448 @@ logging.basicConfig(
     handlers=[logging.FileHandler("logs/app.log"), logging.StreamHandler()]
 )
 
+MANIFEST_PATH = "./RAG/chunks/manifest.json"
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9])")
+
+_tokenizer = None
+_minhasher = None
+
 def clean_text(text):
     """Remove newline characters and extra spaces."""
     return ' '.join(str(text).strip().replace('\n', ' ').split())
 
-def build_chunk_from_entry(entry):
-    """Construct a cleaned and structured chunk from a disease or drug entry."""
-    name = clean_text(entry.get("name", "Unknown"))
-    description = clean_text(entry.get("description", ""))
-    symptoms = clean_text(entry.get("symptoms", ""))
-    cause = clean_text(entry.get("cause", ""))
-    precautions = clean_text(entry.get("precautions", ""))
-    treatment = clean_text(entry.get("treatment", ""))
-    drugs = entry.get("drugs", "")
-    drug_desc = entry.get("drug_descriptions", {})
-
-    chunk = f"Disease: {name}. Description: {description}."
-
-    if symptoms:
-        chunk += f" Symptoms: {symptoms}."
-    if cause:
-        chunk += f" Cause: {cause}."
-    if precautions:
-        chunk += f" Precautions: {precautions}."
-    if treatment:
-        chunk += f" Treatment: {treatment}."
+def build_sections(item):
+    """(entity, header, [(section, text)]) for a raw record, or None if it is not a usable entry.
+
+    Joining the section texts with spaces gives the original single-chunk text.
+    """
+    if not isinstance(item, dict) or "name" not in item or "description" not in item:
+        return None
+    name = clean_text(item["name"])
+    description = clean_text(item["description"])
+
+    if len(item.keys()) <= 2:
+        header = f"Drug Name: {name}."
+        return name, header, [("overview", f"{header} Description: {description}.")]
+
+    header = f"Disease: {name}."
+    sections = [("overview", f"{header} Description: {description}.")]
+    for field, label in (("symptoms", "Symptoms"), ("cause", "Cause"), ("precautions", "Precautions"),
+                         ("treatment", "Treatment")):
+        value = clean_text(item.get(field, ""))
+        if value:
+            sections.append((field, f"{label}: {value}."))
+    drugs = item.get("drugs", "")
     if drugs:
-        chunk += f" Drugs: {drugs}."
+        sections.append(("drugs", f"Drugs: {drugs}."))
 
+    drug_desc = item.get("drug_descriptions", {})
     if isinstance(drug_desc, dict):
         for drug, desc in drug_desc.items():
-            chunk += f" Drug Detail - {drug}: {clean_text(desc)}."
+            sections.append(("drug_detail", f"Drug Detail - {drug}: {clean_text(desc)}."))
 
-    return chunk
+    return name, header, sections
 
-def load_and_chunk(data_dir="./RAG/data", return_chunks=False):
-    """Load all JSON files, build chunks, and write them to a timestamped output."""
-    chunks = []
-    seen = set()
+def get_tokenizer():
+    """The embedding model's tokenizer, loaded once per worker process."""
+    global _tokenizer
+    if _tokenizer is None:
+        from transformers import AutoTokenizer
+        _tokenizer = AutoTokenizer.from_pretrained(Config.EMBEDDING_MODEL)
+    return _tokenizer
+
+def count_tokens(text):
+    return len(get_tokenizer().encode(text, add_special_tokens=False))
+
+def fit_section(text, budget):
+    """Split an oversized section into sentence (or, failing that, word) runs of at most `budget` tokens."""
+    if count_tokens(text) <= budget:
+        return [text]
+    parts = []
+    for sentence in SENTENCE_PATTERN.split(text):
+        if count_tokens(sentence) <= budget:
+            parts.append(sentence)
+            continue
+        current, used = [], 0
+        for word in sentence.split():
+            tokens = count_tokens(word)
+            if current and used + tokens > budget:
+                parts.append(" ".join(current))
+                current, used = [], 0
+            current.append(word)
+            used += tokens
+        if current:
+            parts.append(" ".join(current))
+    return parts
+
+def split_record(header, sections, max_tokens):
+    """Pack consecutive sections into (section names, text) chunks of at most `max_tokens` tokens.
+
+    Sections are only split when one alone is over budget. Every chunk after
+    the first starts with the entity header so it still names its disease or
+    drug. A record that fits yields exactly its original single chunk. Each
+    chunk lists every section it covers, so section filters find packed ones.
+    """
+    header_tokens = count_tokens(header)
+    pieces = []
+    for section, text in sections:
+        for part in fit_section(text, max_tokens - header_tokens):
+            tokens = count_tokens(part)
+            if pieces and pieces[-1]["tokens"] + tokens <= max_tokens:
+                pieces[-1]["parts"].append(part)
+                pieces[-1]["tokens"] += tokens
+                if pieces[-1]["sections"][-1] != section:
+                    pieces[-1]["sections"].append(section)
+            elif pieces:
+                pieces.append({"sections": [section], "parts": [header, part], "tokens": header_tokens + tokens})
+            else:
+                pieces.append({"sections": [section], "parts": [part], "tokens": tokens})
+    return [(piece["sections"], " ".join(piece["parts"])) for piece in pieces]
+
+def build_chunks(item, source):
+    """Structured chunks (see chunk_schema) for a raw record; empty if it is not a usable entry."""
+    built = build_sections(item)
+    if built is None:
+        return []
+    entity, header, sections = built
+    max_tokens = Config.CHUNK_MAX_TOKENS - get_tokenizer().num_special_tokens_to_add()
+    return [
+        make_chunk(text, source=source, entity=entity, sections=covered, token_count=count_tokens(text))
+        for covered, text in split_record(header, sections, max_tokens)
+    ]
+
+def record_key(source, item, occurrences):
+    """Manifest key of a record: its source plus a stable id field, or its content hash if it has none.
+
+    Keys do not depend on the record's position, so inserting or deleting a
+    record leaves the keys of the others unchanged. Repeats of an id within
+    a source get a running suffix (#2, #3, ...), tracked in `occurrences`.
+    """
+    ident = None
+    if isinstance(item, dict):
+        ident = next((str(item[f]) for f in Config.RECORD_ID_FIELDS if item.get(f) not in (None, "")), None)
+    key = f"{source}#{ident if ident is not None else record_hash(item)}"
+    occurrences[key] = occurrences.get(key, 0) + 1
+    return key if occurrences[key] == 1 else f"{key}#{occurrences[key]}"
+
+def record_hash(item):
+    """Content hash of a raw source record, independent of key order."""
+    return hashlib.sha256(json.dumps(item, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def load_manifest(manifest_path):
+    """Manifest from the previous run: one entry per source record, plus the chunk file it produced."""
+    if not os.path.exists(manifest_path):
+        return {"records": {}, "output": None}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def chunk_settings():
+    """Settings that shape chunk boundaries; chunks are only reused from a run with the same ones."""
+    return {"max_tokens": Config.CHUNK_MAX_TOKENS, "tokenizer": Config.EMBEDDING_MODEL, "fields": list(CHUNK_FIELDS)}
+
+class PreviousChunks:
+    """Chunks of the previous run's JSONL output, read from disk by id.
+
+    Only an id -> byte offset index is held in memory; a reused chunk is read
+    back with one seek when its record comes up. With no path it is empty.
+    """
+
+    ID_PREFIX = re.compile(rb'^\{"id": "([0-9a-f]{64})"')
+
+    def __init__(self, path=None):
+        self.offsets = {}
+        self._file = open(path, "rb") if path else None
+        if self._file is None:
+            return
+        offset = 0
+        for line in self._file:
+            if line.strip():
+                # Chunk lines start with their id; anything else is parsed in full
+                match = self.ID_PREFIX.match(line)
+                self.offsets[match.group(1).decode() if match else json.loads(line)["id"]] = offset
+            offset += len(line)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.offsets
+
+    def __getitem__(self, chunk_id):
+        self._file.seek(self.offsets[chunk_id])
+        return json.loads(self._file.readline())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+def load_previous_chunks(manifest, output_path=None):
+    """The previous run's chunks (see PreviousChunks), so unchanged records need no rebuild.
+
+    Empty when the settings differ or the previous output would be overwritten by `output_path`.
+    """
+    output = manifest.get("output")
+    if manifest.get("settings") != chunk_settings() or not output or not output.endswith(".jsonl") \
+            or not os.path.exists(output) or output == output_path:
+        return PreviousChunks()
+    return PreviousChunks(output)
 
-    all_files = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.endswith(".json")]
-    logging.info(f"🔍 Found {len(all_files)} JSON files in {data_dir}")
+def reusable_chunks(previous, content_hash, previous_chunks):
+    """The previous chunks of an unchanged record, or None if it must be rebuilt.
 
-    for file in all_files:
+    Records with near-duplicate merges point at another record's chunk, so they are always rebuilt.
+    """
+    if not previous or previous["record_hash"] != content_hash or previous.get("merged"):
+        return None
+    ids = manifest_chunk_ids(previous)
+    if not all(cid in previous_chunks for cid in ids):
+        return None
+    return [previous_chunks[cid] for cid in ids]
+
+def manifest_chunk_ids(entry):
+    # Manifests written before records could split into several chunks hold a single "chunk_id"
+    return entry["chunk_ids"] if "chunk_ids" in entry else [entry["chunk_id"]]
+
+def get_minhasher():
+    global _minhasher
+    if _minhasher is None:
+        _minhasher = MinHasher(Config.MINHASH_PERMUTATIONS, Config.SHINGLE_SIZE)
+    return _minhasher
+
+def process_batch(batch, near_dedup=False):
+    """Worker: [(ref, record hash, record, reused chunks)] -> [(ref, record hash, chunks, signatures, error)].
+
+    `ref` is (manifest key, source file, position in the file).
+
+    Records that come with reused chunks are not rebuilt; only their MinHash
+    signatures are computed when near-duplicate merging is on.
+    """
+    results = []
+    for ref, content_hash, item, reused in batch:
         try:
-            with open(file, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            record_chunks = reused if reused is not None else build_chunks(item, ref[1])
+            signatures = [get_minhasher().signature(c["text"]) for c in record_chunks] if near_dedup else None
+            results.append((ref, content_hash, record_chunks, signatures, None))
         except Exception as e:
-            logging.error(f"❌ Failed to load {file}: {e}")
-            continue
+            results.append((ref, content_hash, [], None, str(e)))
+    return results
 
-        count_before = len(chunks)
+def plan_batches(batches, previous_records, previous_chunks, counts):
+    """Hash records in the main process and attach the previous chunks of unchanged ones."""
+    for batch in batches:
+        planned = []
+        for ref, item in batch:
+            content_hash = record_hash(item)
+            reused = reusable_chunks(previous_records.get(ref[0]), content_hash, previous_chunks)
+            if reused is not None:
+                counts["reused"] += 1
+            planned.append((ref, content_hash, None if reused is not None else item, reused))
+        yield planned
 
-        for idx, item in enumerate(data):
-            try:
-                if not isinstance(item, dict):
-                    continue
+def iter_batches(files, batch_size):
+    """Stream ((key, source, position), record) batches from every source file without loading whole files."""
+    for file in files:
+        source = os.path.basename(file)
+        batch = []
+        occurrences = {}
+        try:
+            for idx, item in enumerate(iter_records(file)):
+                batch.append(((record_key(source, item, occurrences), source, idx), item))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        except Exception as e:
+            logging.error(f"❌ Failed to read {file}: {e}")
+        if batch:
+            yield batch
 
-                if "name" in item and "description" in item:
-                    if len(item.keys()) > 2:
-                        chunk = build_chunk_from_entry(item)
-                    else:
-                        chunk = f"Drug Name: {clean_text(item['name'])}. Description: {clean_text(item['description'])}."
+def parallel_map(fn, items, workers, max_pending):
+    """Ordered map over a process pool with at most `max_pending` batches in flight."""
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
-                    chunk_hash = hashlib.sha256(chunk.encode()).hexdigest()
+def write_near_duplicate_report(path, index, labels):
+    """Write the clusters merged by the near-duplicate stage, largest first."""
+    clusters = sorted(index.clusters.items(), key=lambda item: len(item[1]), reverse=True)
+    report = {
+        "threshold": index.threshold,
+        "num_perm": Config.MINHASH_PERMUTATIONS,
+        "bands": index.bands,
+        "shingle_size": Config.SHINGLE_SIZE,
+        "merged": index.merged,
+        "clusters": [
+            {
+                "representative": {"id": rep, **labels[rep]},
+                "members": [{"id": cid, **labels[cid], "similarity": round(sim, 4)} for cid, sim in members]
+            }
+            for rep, members in clusters
+        ]
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
 
-                    if chunk_hash not in seen:
-                        seen.add(chunk_hash)
-                        chunks.append(chunk)
+def load_and_chunk(data_dir="./RAG/data", return_chunks=False, manifest_path=MANIFEST_PATH, incremental=True,
+                   workers=None, batch_size=1000, near_dedup=Config.NEAR_DUPLICATE_DEDUP,
+                   near_dup_threshold=Config.NEAR_DUPLICATE_THRESHOLD):
+    """Stream all source files, build chunks, and write them to a timestamped JSONL output.
+
+    Sources may be JSON arrays or JSONL, optionally gzipped; they are parsed
+    incrementally and chunks are built in batches on a process pool, with the
+    chunk and delta files written as results arrive. Memory stays bounded by
+    the batches in flight plus per-chunk hashes and signatures (and, in
+    incremental runs, an id -> offset index of the previous output; reused
+    chunks are read back from disk). Each output line is a chunk record (see
+    chunk_schema.CHUNK_FIELDS).
 
-            except Exception as e:
-                logging.error(f"❌ Error in {file}, entry #{idx}: {e}")
-                continue
+    With `incremental`, each record's content hash is compared against the
+    manifest: unchanged records reuse their chunks from the previous output
+    instead of being re-tokenized, and every run writes a delta file (added,
+    changed, removed) that the embedding and upsert steps can consume
+    instead of the whole corpus.
+
+    With `near_dedup`, chunks whose MinHash-estimated Jaccard similarity to
+    an earlier chunk of the same entity reaches `near_dup_threshold` are
+    merged into it: they
+    are not written, their records point at the kept chunk, and the merged
+    clusters are reported in *_near_duplicates.json.
+    """
+    manifest = load_manifest(manifest_path) if incremental else {"records": {}, "output": None}
+    previous_records = manifest["records"]
+    workers = workers or os.cpu_count() or 1
+
+    chunks = [] if return_chunks else None
+    seen = set()
+    records = {}
+    changed = []
+    added = 0
+    split = 0
+    counts = {"new": 0, "changed": 0, "unchanged": 0, "reused": 0}
+    per_source = {}
 
-        logging.info(f"📦 Processed {file} — added {len(chunks) - count_before} unique chunks.")
+    all_files = list_sources(data_dir)
+    logging.info(f"🔍 Found {len(all_files)} source files in {data_dir} — chunking on {workers} workers")
 
     # Ensure output directory exists
     os.makedirs("./RAG/chunks", exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_path = f"./RAG/chunks/{timestamp}_chunks.jsonl"
+    delta_path = f"./RAG/chunks/{timestamp}_delta.json"
+    previous_chunks = load_previous_chunks(manifest, output_path) if incremental else PreviousChunks()
+    previous_ids = {cid for entry in previous_records.values() for cid in manifest_chunk_ids(entry)}
+    dedup_index = NearDuplicateIndex(near_dup_threshold, Config.MINHASH_PERMUTATIONS, Config.MINHASH_BANDS) \
+        if near_dedup else None
+    merged_into = {}
+    labels = {}
+
+    with open(output_path, "w", encoding="utf-8") as out, open(delta_path, "w", encoding="utf-8") as delta:
+        delta.write(f'{{"previous_output": {json.dumps(manifest.get("output"))}, '
+                    f'"output": {json.dumps(output_path)}, "added": [')
+
+        batches = plan_batches(iter_batches(all_files, batch_size), previous_records, previous_chunks, counts)
+        worker = functools.partial(process_batch, near_dedup=near_dedup)
+        for results in parallel_map(worker, batches, workers, max_pending=workers * 2):
+            for (key, source, idx), content_hash, record_chunks, signatures, error in results:
+                if error is not None:
+                    logging.error(f"❌ Error in {source}, entry #{idx}: {error}")
+                    continue
+                if not record_chunks:
+                    continue
+
+                previous = previous_records.get(key)
+                if previous is None:
+                    counts["new"] += 1
+                elif previous["record_hash"] == content_hash:
+                    counts["unchanged"] += 1
+                else:
+                    counts["changed"] += 1
+                if len(record_chunks) > 1:
+                    split += 1
+
+                ids = []
+                merged = False
+                for position, chunk in enumerate(record_chunks):
+                    if chunk["id"] in merged_into:
+                        ids.append(merged_into[chunk["id"]])
+                        merged = True
+                        continue
+                    ids.append(chunk["id"])
+                    if chunk["id"] in seen:
+                        continue
+
+                    if dedup_index is not None:
+                        labels[chunk["id"]] = {"source": source, "entity": chunk["entity"]}
+                        # Chunks only merge within one entity, so no disease or drug disappears from the index
+                        representative, _ = dedup_index.add(chunk["id"], signatures[position], chunk["entity"])
+                        if representative != chunk["id"]:
+                            merged_into[chunk["id"]] = ids[-1] = representative
+                            merged = True
+                            continue
+
+                    seen.add(chunk["id"])
+                    per_source[source] = per_source.get(source, 0) + 1
+                    line = json.dumps(chunk, ensure_ascii=False)
+                    out.write(line + "\n")
+                    if chunk["id"] not in previous_ids:
+                        delta.write(("" if added == 0 else ", ") + line)
+                        added += 1
+                    if chunks is not None:
+                        chunks.append(chunk)
+
+                if previous and manifest_chunk_ids(previous) != ids:
+                    changed.append({"record": key, "previous_ids": manifest_chunk_ids(previous), "ids": ids})
+                records[key] = {"source": source, "index": int(idx), "record_hash": content_hash, "chunk_ids": ids}
+                if merged:
+                    records[key]["merged"] = True
+
+        removed = sorted(previous_ids - seen)
+        delta.write(f'], "changed": {json.dumps(changed)}, "removed": {json.dumps(removed)}}}\n')
+    previous_chunks.close()
+
+    for source, count in per_source.items():
+        logging.info(f"📦 Processed {source} — added {count} unique chunks.")
+
+    if dedup_index is not None:
+        report_path = f"./RAG/chunks/{timestamp}_near_duplicates.json"
+        write_near_duplicate_report(report_path, dedup_index, labels)
+        logging.info(
+            f"🧬 Near-duplicates: merged {dedup_index.merged} chunks into {len(dedup_index.clusters)} clusters "
+            f"(Jaccard >= {near_dup_threshold}) — report saved to {report_path}"
+        )
 
-    # Save to file
-    output_path = f"./RAG/chunks/{datetime.now().strftime('%Y%m%d_%H%M%S')}_chunks.json"
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, indent=2, ensure_ascii=False)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"created": timestamp, "output": output_path, "delta": delta_path, "settings": chunk_settings(),
+                   "records": records}, f, indent=2)
 
-    logging.info(f"✅ Finished: Created and saved {len(chunks)} unique chunks to {output_path}")
+    logging.info(f"✅ Finished: Created and saved {len(seen)} unique chunks to {output_path}")
+    logging.info(f"✂️ {split} records split to fit {Config.CHUNK_MAX_TOKENS} tokens")
+    logging.info(f"♻️ Reused the previous chunks of {counts['reused']} unchanged records")
+    logging.info(
+        f"🧾 Records: {counts['new']} new, {counts['changed']} changed, {counts['unchanged']} unchanged — "
+        f"delta: +{added} / -{len(removed)} chunks saved to {delta_path}"
+    )
 
     if return_chunks:
         return chunks
 
 if __name__ == "__main__":
-    load_and_chunk()
+    parser = argparse.ArgumentParser(description="Build chunks from RAG/data")
+    parser.add_argument("--data-dir", default="./RAG/data", help="Directory of .json/.jsonl sources (optionally .gz)")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and rebuild every record")
+    parser.add_argument("--workers", type=int, default=None, help="Chunking processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Records per worker batch")
+    parser.add_argument("--no-near-dedup", action="store_true", help="Keep near-duplicate chunks")
+    parser.add_argument("--near-dup-threshold", type=float, default=Config.NEAR_DUPLICATE_THRESHOLD,
+                        help="Estimated Jaccard similarity at which chunks are merged")
+    args = parser.parse_args()
+    load_and_chunk(
+        args.data_dir, incremental=not args.full, workers=args.workers, batch_size=args.batch_size,
+        near_dedup=Config.NEAR_DUPLICATE_DEDUP and not args.no_near_dedup,
+        near_dup_threshold=args.near_dup_threshold
+    )
@@ -1,9 +1,16 @@
 import json
-import numpy as np
 import logging
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
+from config import Config
+from encoders import load_encoder, encoder_id, resolve_revision
+from embedding_store import EmbeddingStore
+from chunk_text_store import ChunkTextStore
+from embedding_artifacts import write_artifact, mark_latest
+from chunk_schema import load_chunks
 import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 
 # Load environment variables
@@ -19,44 +26,195 @@ logging.basicConfig(
     ]
 )
 
-# Load embedding model
+# Embedding model: loaded only when some chunks are not in the embedding store yet
 MODEL_NAME = 'pritamdeka/BioBERT-mnli-snli-scinli-scitail-mednli-stsb'
-logging.info(f"Loading embedding model: {MODEL_NAME}")
-model = SentenceTransformer(MODEL_NAME)
+MODEL_ID = encoder_id(Config.ENCODER_BACKEND, MODEL_NAME)
 
 # File paths
-CHUNK_FILE = "./RAG/chunks/20250804_221234_chunks.json"
-EMBED_DIR = "./RAG/embeddings"
-EMBED_FILE = os.path.join(EMBED_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_embeddings.npy")
+CHUNKS_MANIFEST = "./RAG/chunks/manifest.json"
+EMBED_DIR = Config.EMBEDDINGS_DIR
 
 # Make directory if missing
 os.makedirs(EMBED_DIR, exist_ok=True)
 
-def embed_chunks():
+def latest_chunk_file(manifest_path=CHUNKS_MANIFEST):
+    """Chunk file written by the last generate_chunks run, or Config.CHUNKS_FILE if there is none."""
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            output = json.load(f).get("output")
+        if output and os.path.exists(output):
+            return output
+    return Config.CHUNKS_FILE
+
+def token_length(chunk):
+    # token_count comes from generate_chunks; legacy chunk files fall back to a word count
+    return chunk.get("token_count") or len(chunk["text"].split())
+
+def plan_shards(chunk_ids, lengths, batch_size, shard_size):
+    """Sort chunks by length, then cut into shards of whole batches.
+
+    SentenceTransformer.encode only sorts within one call, so sorting the
+    whole delta first keeps the batches of every shard as tight as a single
+    call over all chunks would.
+    """
+    order = sorted(chunk_ids, key=lengths.get)
+    shard_size = max(batch_size, shard_size // batch_size * batch_size)
+    return [order[i:i + shard_size] for i in range(0, len(order), shard_size)]
+
+def padding_efficiency(lengths, batch_size):
+    """Share of real tokens among all tokens a batch padded to its longest member would process."""
+    real = padded = 0
+    for i in range(0, len(lengths), batch_size):
+        batch = lengths[i:i + batch_size]
+        real += sum(batch)
+        padded += max(batch) * len(batch)
+    return real / padded if padded else 1.0
+
+_worker_model = None
+
+def init_worker(threads, revision):
+    """Load the encoder once per worker process, at the resolved commit the vectors are stored under."""
+    global _worker_model
+    _worker_model = load_encoder(Config.ENCODER_BACKEND, MODEL_NAME, threads=threads, revision=revision)
+
+def encode_shard(shard_index, chunk_ids, texts, batch_size):
+    vectors = _worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    return shard_index, chunk_ids, vectors
+
+def encode_missing(store, missing, texts, lengths, workers, revision, batch_size=Config.EMBED_BATCH_SIZE,
+                   shard_size=Config.EMBED_SHARD_SIZE):
+    """Encode `missing` chunks in length-sorted shards on a pool of encoder processes.
+
+    Each finished shard is committed to the embedding store straight away,
+    so an interrupted run resumes with only the shards that never finished.
+    Returns (chunks per second, padding efficiency of the sorted batches).
+    """
+    shards = plan_shards(missing, lengths, batch_size, shard_size)
+    workers = min(workers, len(shards))
+    done = 0
+    failed = []
+    start = time.time()
+
+    def checkpoint(shard_index, chunk_ids, vectors):
+        nonlocal done
+        store.put_many(chunk_ids, vectors, MODEL_ID, revision)
+        done += len(chunk_ids)
+        rate = done / max(time.time() - start, 1e-9)
+        logging.info(
+            f"💾 Shard {shard_index + 1}/{len(shards)} checkpointed — {done}/{len(missing)} chunks, "
+            f"{rate:.1f} chunks/sec"
+        )
+
+    def collect(run_shard, shard_index):
+        # A failed shard is logged and retried on the next run; the others are still checkpointed
+        try:
+            checkpoint(*run_shard())
+        except Exception as e:
+            failed.append(shard_index)
+            logging.error(f"❌ Shard {shard_index + 1}/{len(shards)} failed: {e}")
+
+    def task(shard_index):
+        chunk_ids = shards[shard_index]
+        return shard_index, chunk_ids, [texts[cid] for cid in chunk_ids], batch_size
+
+    if workers <= 1:
+        init_worker(Config.ENCODER_THREADS, revision)
+        for shard_index in range(len(shards)):
+            collect(lambda: encode_shard(*task(shard_index)), shard_index)
+    else:
+        # Split the cores between workers instead of letting every torch pool claim all of them
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(threads, revision)) as pool:
+            pending = {}
+            next_shard = 0
+            while next_shard < len(shards) or pending:
+                while next_shard < len(shards) and len(pending) < workers * 2:
+                    pending[pool.submit(encode_shard, *task(next_shard))] = next_shard
+                    next_shard += 1
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future.result, pending.pop(future))
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(shards)} shards failed; rerun to encode only what is left")
+
+    chunks_per_sec = len(missing) / max(time.time() - start, 1e-9)
+    sorted_lengths = [lengths[cid] for shard in shards for cid in shard]
+    return chunks_per_sec, padding_efficiency(sorted_lengths, batch_size)
+
+def embed_chunks(chunk_file=None, output_dir=None, store_path=Config.EMBEDDING_STORE_PATH, workers=None,
+                 mark_as_latest=True):
+    """Build the embedding artifact for a chunk file, encoding only chunks the store has not seen.
+
+    Embeddings are cached by (chunk hash, model id, model revision); the
+    artifact shards are then assembled from the store in chunk-file order
+    and, with `mark_as_latest`, LATEST is pointed at the new artifact.
+    Returns the artifact's manifest path.
+    """
+    chunk_file = chunk_file or latest_chunk_file()
+    output_dir = output_dir or os.path.join(EMBED_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_embeddings")
+    workers = workers or Config.EMBED_WORKERS or min(4, os.cpu_count() or 1)
+
     # Check if chunk file exists
-    if not os.path.exists(CHUNK_FILE):
-        logging.error(f"Chunk file not found: {CHUNK_FILE}")
+    if not os.path.exists(chunk_file):
+        logging.error(f"Chunk file not found: {chunk_file}")
         return
 
-    with open(CHUNK_FILE, "r", encoding="utf-8") as f:
-        try:
-            chunks = json.load(f)
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to decode JSON: {e}")
-            return
-
-    # Clean up chunks
-    valid_chunks = [chunk.strip() for chunk in chunks if isinstance(chunk, str) and chunk.strip()]
-    if not valid_chunks:
+    try:
+        chunks = load_chunks(chunk_file)
+    except json.JSONDecodeError as e:
+        logging.error(f"Failed to decode JSON: {e}")
+        return
+    if not chunks:
         logging.warning("No valid chunks found for embedding.")
         return
 
-    logging.info(f"Encoding {len(valid_chunks)} medical chunks...")
-    embeddings = model.encode(valid_chunks, convert_to_numpy=True, show_progress_bar=True)
+    # One embedding row per chunk record, in file order, so rows line up with the chunk file
+    chunk_ids = [chunk["id"] for chunk in chunks]
+    texts = {chunk["id"]: chunk["text"] for chunk in chunks}
+    lengths = {chunk["id"]: token_length(chunk) for chunk in chunks}
+    store = EmbeddingStore(store_path)
+    # Key on the model's commit hash, never a placeholder, so different hub snapshots never mix
+    revision = resolve_revision(MODEL_NAME)
+    missing = store.missing(chunk_ids, MODEL_ID, revision)
+    logging.info(
+        f"🗃️ {len(texts) - len(missing)} of {len(texts)} chunks already embedded with {MODEL_ID}@{revision}"
+    )
+
+    if missing:
+        # Every worker process loads its own copy of the model, which only pays off for large deltas
+        if len(missing) < Config.EMBED_PARALLEL_MIN_CHUNKS:
+            workers = 1
+        logging.info(f"Encoding {len(missing)} new medical chunks on {workers} worker(s)...")
+        chunks_per_sec, efficiency = encode_missing(store, missing, texts, lengths, workers, revision)
+        logging.info(
+            f"⏱️ Encoded {len(missing)} chunks at {chunks_per_sec:.1f} chunks/sec — padding efficiency "
+            f"{efficiency:.1%} of length-sorted batches"
+        )
+
+    manifest_path = write_artifact(
+        output_dir, chunk_ids, lambda ids: store.get_matrix(ids, MODEL_ID, revision),
+        MODEL_ID, revision, chunk_file,
+        dtype=Config.EMBEDDING_SHARD_DTYPE, shard_rows=Config.EMBEDDING_SHARD_ROWS
+    )
+    store.close()
+
+    # Services resolve hit ids to text through the chunk text store and only read it
+    text_store = ChunkTextStore()
+    text_store.put_many(texts.items())
+    text_store.close()
+    if mark_as_latest:
+        mark_latest(manifest_path, EMBED_DIR)
 
-    np.save(EMBED_FILE, embeddings)
-    logging.info(f"Saved embeddings to: {EMBED_FILE}")
-    logging.info(f"Embeddings shape: {embeddings.shape}")
+    logging.info(f"Saved embeddings to: {manifest_path}{' (now LATEST)' if mark_as_latest else ''}")
+    return manifest_path
 
 if __name__ == "__main__":
-    embed_chunks()
+    parser = argparse.ArgumentParser(description="Embed a chunk file, reusing cached embeddings")
+    parser.add_argument("--chunks", default=None, help="Chunk file (default: output of the last generate_chunks run)")
+    parser.add_argument("--output", default=None, help="Artifact directory (default: timestamped, in RAG/embeddings)")
+    parser.add_argument("--store", default=Config.EMBEDDING_STORE_PATH, help="SQLite embedding store")
+    parser.add_argument("--workers", type=int, default=None, help="Encoder processes (default: EMBED_WORKERS)")
+    parser.add_argument("--no-latest", action="store_true", help="Do not point LATEST at the new artifact")
+    args = parser.parse_args()
+    embed_chunks(args.chunks, args.output, args.store, args.workers, mark_as_latest=not args.no_latest)
@@ -113,7 +113,11 @@ def retrieve_facts_and_grouped(tx, user_input: str) -> Dict[str, Any]:
     return {"grouped": grouped_data, "triples": triples}
 
 
-# ===== API Endpoint =====
+# ===== API Endpoints =====
+@app.get("/health")
+def health_check():
+    return {"status": "ok"}
+
 @app.get("/knowledgegraphapi", response_model=SearchResponse)
 def get_medical_kg_data(query: str = Query(..., description="Disease name or symptom")):
     try:
@@ -0,0 +1,74 @@
+import re
+import math
+import logging
+from collections import Counter, defaultdict
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+class BM25Index:
+    """In-memory inverted index with Okapi BM25 scoring.
+
+    Posting weights are precomputed at build time, so a query only sums the
+    postings of its own terms.
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.size = len(documents)
+        postings = defaultdict(lambda: ([], []))
+        doc_lengths = np.zeros(self.size, dtype=np.float32)
+
+        for doc_id, text in enumerate(documents):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term][0].append(doc_id)
+                postings[term][1].append(tf)
+
+        avg_length = float(doc_lengths.mean()) if self.size else 0.0
+        self.postings = {}
+        for term, (doc_ids, tfs) in postings.items():
+            doc_ids = np.asarray(doc_ids, dtype=np.int64)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            idf = math.log(1 + (self.size - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            norm = k1 * (1 - b + b * doc_lengths[doc_ids] / (avg_length or 1.0))
+            self.postings[term] = (doc_ids, idf * tfs * (k1 + 1) / (tfs + norm))
+
+        logging.info(f"🔤 Built BM25 index: {self.size} documents, {len(self.postings)} terms")
+
+    def search(self, query, top_k, rows=None):
+        """Return (indices, scores) of the top_k documents; documents sharing no term are skipped.
+
+        `rows` optionally restricts the candidates (e.g. to a metadata filter's matches).
+        """
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in self.postings:
+                doc_ids, weights = self.postings[term]
+                scores[doc_ids] += weights
+        if rows is not None:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[rows] = True
+            scores[~mask] = 0.0
+
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return matched, scores[matched]
+        top_k = min(top_k, len(matched))
+        best = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        best = best[np.argsort(-scores[best])]
+        return best, scores[best]
+
+
+def reciprocal_rank_fusion(rankings, weights, k=60):
+    """Merge ranked index lists: score(d) = sum_i weight_i / (k + rank_i(d)), ranks starting at 1."""
+    fused = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, idx in enumerate(ranking, start=1):
+            fused[int(idx)] += weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -1,26 +1,196 @@
-import uvicorn
-import threading
+import gc
+import os
+import json
 import time
+import signal
+import socket
 import logging
+import importlib
+import multiprocessing
+import urllib.request
+import uvicorn
 from config import Config
-
-# Import all API modules
-from chunk_api import app as chunk_app
-from embeddings_api import app as embeddings_app
-from knowledgegraph_api import app as kg_app
+from encoders import get_encoder
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def run_api(app, port, name):
-    """Run a FastAPI app on specified port"""
+# Workers are forked so they inherit the preloaded encoder weights copy-on-write
+mp = multiprocessing.get_context("fork")
+
+
+class Service:
+    """One API: its module, port, worker count, torch thread budget per worker and whether it runs BioBERT."""
+
+    def __init__(self, name, module, port, workers, torch_threads=1, uses_encoder=False):
+        self.name = name
+        self.module = module
+        self.port = port
+        self.workers = max(1, workers)
+        self.torch_threads = torch_threads
+        self.uses_encoder = uses_encoder
+        self.socket = None
+        self.processes = []
+        self.pgid = None
+        # Per worker slot: start time, consecutive fast failures and pending restart time
+        self.started = []
+        self.fast_failures = []
+        self.restart_at = []
+
+
+def plan_services():
+    """Build the service table, splitting CPU cores across the workers that run BioBERT."""
+    encoder_workers = Config.CHUNK_API_WORKERS + Config.EMBEDDINGS_API_WORKERS
+    default_threads = max(1, (os.cpu_count() or 1) // max(1, encoder_workers))
+    return [
+        Service("Chunk API", "chunk_api", Config.CHUNK_API_PORT, Config.CHUNK_API_WORKERS,
+                Config.CHUNK_API_TORCH_THREADS or default_threads, uses_encoder=True),
+        Service("Embeddings API", "embeddings_api", Config.EMBEDDINGS_API_PORT, Config.EMBEDDINGS_API_WORKERS,
+                Config.EMBEDDINGS_API_TORCH_THREADS or default_threads, uses_encoder=True),
+        Service("Knowledge Graph API", "knowledgegraph_api", Config.KNOWLEDGE_GRAPH_API_PORT,
+                Config.KNOWLEDGE_GRAPH_API_WORKERS),
+    ]
+
+
+def bind_socket(port):
+    """Bind the listening socket once in the supervisor; every worker of the service accepts on it."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((Config.HOST, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def limit_threads(threads):
+    """Cap the OpenMP/MKL and torch intra-op thread pools of this process."""
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def preloads_encoder():
+    """ONNX Runtime sessions do not survive fork and size their pool at creation, so only torch is preloaded."""
+    return Config.ENCODER_BACKEND != "onnx"
+
+
+def serve_worker(service):
+    """Worker process entry point: pin torch threads, import the app and serve on the shared socket."""
+    limit_threads(service.torch_threads)
+    if service.uses_encoder and not preloads_encoder():
+        # The worker's own session, sized to its thread budget; the app picks it up from the registry
+        get_encoder(warm=False, threads=service.torch_threads)
+
+    # Restore default signal handling; uvicorn installs its own graceful handlers
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    app = importlib.import_module(service.module).app
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=[service.socket])
+
+
+def start_worker(service):
+    """Fork one worker into the service's process group. Callers record its slot's start time."""
+    process = mp.Process(target=serve_worker, args=(service,), name=f"{service.module}-worker", daemon=False)
+    process.start()
+    # All workers of a service share one process group so they can be signalled together
     try:
-        uvicorn.run(app, host=Config.HOST, port=port, log_level="info")
-    except Exception as e:
-        logger.error(f"Failed to start {name} API on port {port}: {e}")
+        os.setpgid(process.pid, service.pgid or process.pid)
+    except OSError:
+        # The group leader is gone (e.g. a restarted worker); start a new group
+        os.setpgid(process.pid, process.pid)
+        service.pgid = None
+    service.pgid = service.pgid or process.pid
+    return process
+
+
+def restart_delay(fast_failures):
+    """Seconds to wait before restarting a worker: exponential in its consecutive fast failures."""
+    return min(Config.WORKER_RESTART_BACKOFF_MAX, Config.WORKER_RESTART_BACKOFF * 2 ** max(0, fast_failures - 1))
+
+
+def supervise(service, now):
+    """Schedule and perform restarts of the service's dead workers.
+
+    Returns False once a worker has failed fast WORKER_MAX_FAST_FAILURES
+    times in a row, i.e. it is crash-looping and restarting it is pointless.
+    """
+    for i, process in enumerate(service.processes):
+        if process.is_alive():
+            continue
+        if service.restart_at[i] is None:
+            if now - service.started[i] < Config.WORKER_FAST_FAILURE_SECONDS:
+                service.fast_failures[i] += 1
+            else:
+                service.fast_failures[i] = 0
+            if service.fast_failures[i] >= Config.WORKER_MAX_FAST_FAILURES:
+                logger.error(f"❌ {service.name} worker {process.pid} exited ({process.exitcode}) after "
+                             f"{service.fast_failures[i]} fast failures in a row, giving up")
+                return False
+            delay = restart_delay(service.fast_failures[i])
+            service.restart_at[i] = now + delay
+            logger.warning(f"⚠️ {service.name} worker {process.pid} exited ({process.exitcode}), "
+                           f"restarting in {delay}s")
+        elif now >= service.restart_at[i]:
+            service.processes[i] = start_worker(service)
+            service.started[i] = now
+            service.restart_at[i] = None
+    return True
+
+
+def wait_until_ready(services, timeout):
+    """Poll every service's /health until it reports ok."""
+    deadline = time.time() + timeout
+    pending = list(services)
+    while pending and time.time() < deadline:
+        for service in list(pending):
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{service.port}/health", timeout=2) as resp:
+                    if json.load(resp).get("status") == "ok":
+                        logger.info(f"✅ {service.name} ready ({service.workers} workers, "
+                                    f"{service.torch_threads} torch threads each)")
+                        pending.remove(service)
+            except Exception:
+                pass
+        time.sleep(0.5)
+    return not pending
+
+
+def shutdown(services, timeout):
+    """SIGTERM every process group, let uvicorn drain in-flight requests, then SIGKILL stragglers."""
+    for service in services:
+        try:
+            os.killpg(service.pgid, signal.SIGTERM)
+        except (ProcessLookupError, TypeError):
+            pass
+        # Workers restarted into a different group are signalled directly (once: a second
+        # SIGTERM would make uvicorn skip draining)
+        for process in service.processes:
+            try:
+                if os.getpgid(process.pid) != service.pgid:
+                    os.kill(process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    deadline = time.time() + timeout
+    for service in services:
+        for process in service.processes:
+            process.join(max(0, deadline - time.time()))
+            if process.is_alive():
+                logger.warning(f"⚠️ {service.name} worker {process.pid} did not exit in time, killing it")
+                process.kill()
+                process.join()
+        if service.socket:
+            service.socket.close()
+
 
 def main():
-    """Start all RAG APIs"""
+    """Start all RAG APIs as supervised worker processes"""
     # Validate configuration
     try:
         Config.validate()
@@ -29,32 +199,59 @@ def main():
         logger.error(f"❌ Configuration error: {e}")
         return
 
-    # Start APIs in separate threads
-    apis = [
-        (chunk_app, Config.CHUNK_API_PORT, "Chunk API"),
-        (embeddings_app, Config.EMBEDDINGS_API_PORT, "Embeddings API"),
-        (kg_app, Config.KNOWLEDGE_GRAPH_API_PORT, "Knowledge Graph API")
-    ]
+    services = plan_services()
+
+    # Loading (and int8 quantization) can initialise OpenMP in the parent, and forked workers
+    # inherit that pool, so cap threads before the encoder loads, at the largest worker budget.
+    limit_threads(max(service.torch_threads for service in services))
+
+    # Load the shared BioBERT weights once, before forking, so workers share them copy-on-write.
+    # Warm-up happens in each worker so the parent does not spin up a full thread pool before fork.
+    if preloads_encoder():
+        get_encoder(warm=False)
+        logger.info("✅ Shared encoder loaded")
+    else:
+        logger.info("ℹ️ ONNX encoder sessions are created in each worker")
+    gc.freeze()  # Keep the GC from touching (and so copying) the preloaded objects in workers
+
+    stopping = False
+    failed = False
 
-    threads = []
-    for app, port, name in apis:
-        thread = threading.Thread(target=run_api, args=(app, port, name), daemon=True)
-        thread.start()
-        threads.append(thread)
-        logger.info(f"🚀 Started {name} on port {port}")
-        time.sleep(1)  # Small delay between starts
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
 
-    logger.info("🎉 All RAG APIs are running!")
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    for service in services:
+        service.socket = bind_socket(service.port)
+        service.processes = [start_worker(service) for _ in range(service.workers)]
+        service.started = [time.time()] * service.workers
+        service.fast_failures = [0] * service.workers
+        service.restart_at = [None] * service.workers
+        logger.info(f"🚀 Started {service.name} on port {service.port} (process group {service.pgid})")
+
+    if wait_until_ready(services, Config.READINESS_TIMEOUT):
+        logger.info("🎉 All RAG APIs are running!")
+    else:
+        logger.error("❌ Not every API reported ready before the readiness timeout")
     logger.info(f"📡 Chunk API: http://localhost:{Config.CHUNK_API_PORT}")
     logger.info(f"🧠 Embeddings API: http://localhost:{Config.EMBEDDINGS_API_PORT}")
     logger.info(f"🔗 Knowledge Graph API: http://localhost:{Config.KNOWLEDGE_GRAPH_API_PORT}")
 
-    # Keep main thread alive
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        logger.info("🛑 Shutting down RAG APIs...")
+    # Supervise: replace workers that die unexpectedly (with backoff) until asked to stop
+    while not stopping:
+        for service in services:
+            if not stopping and not supervise(service, time.time()):
+                stopping = failed = True
+        time.sleep(1)
+
+    logger.info("🛑 Shutting down RAG APIs...")
+    shutdown(services, Config.SHUTDOWN_TIMEOUT)
+    if failed:
+        raise SystemExit(1)
+
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
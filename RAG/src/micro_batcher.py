@@ -0,0 +1,85 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+import numpy as np
+
+
+class MicroBatcher:
+    """Dynamic micro-batching in front of an encoder.
+
+    Concurrent callers submit texts; a single worker thread waits up to
+    `max_wait_ms` (or until `max_batch_size` texts are queued), encodes them
+    in one forward pass and hands each caller its own rows back.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=32, max_wait_ms=5):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        """Queue texts for encoding and return a Future resolving to their embeddings."""
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future
+
+    def encode(self, texts, timeout=None):
+        """Blocking helper: submit texts and wait for their embeddings."""
+        return self.submit(texts).result(timeout=timeout)
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the wait expires."""
+        first = self._queue.get()
+        if first is None:
+            return None
+        pending = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            if pending is None:
+                return
+
+            texts = [text for item_texts, _ in pending for text in item_texts]
+            try:
+                embeddings = np.asarray(self.encode_fn(texts))
+            except Exception as e:
+                logging.error(f"Batch encode failed for {len(texts)} texts: {e}")
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, future in pending:
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
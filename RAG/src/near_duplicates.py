@@ -0,0 +1,90 @@
+import re
+import zlib
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def shingles(text, size=3):
+    """Word n-grams of the text with case, punctuation and whitespace normalized away."""
+    words = TOKEN_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures from universal hashing of crc32 shingle hashes.
+
+    The permutations depend only on the seed, so signatures computed in
+    different worker processes are comparable.
+    """
+
+    def __init__(self, num_perm=128, shingle_size=3, seed=1):
+        rng = np.random.RandomState(seed)
+        # a, b < 2**32 and crc32 < 2**32 keep a * h + b inside uint64 without overflow
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.shingle_size = shingle_size
+
+    def signature(self, text):
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles(text, self.shingle_size)), dtype=np.uint64
+        )
+        return ((np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME).min(axis=0)
+
+
+class NearDuplicateIndex:
+    """Streaming MinHash-LSH index that maps each chunk to a kept representative.
+
+    Signatures are split into `bands` bands; chunks of the same group that
+    share any band bucket are candidates, and a candidate is accepted when
+    the signatures agree on at least `threshold` of their positions (the
+    MinHash estimate of Jaccard similarity). Chunks in different groups are
+    never merged, so labels that differ only in the drug or disease name
+    stay separate when the entity is the group. The first chunk of every
+    cluster is kept and later members are merged into it, so results are
+    deterministic for a given input order.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=128, bands=16):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+        self.clusters = {}
+
+    def _band_keys(self, signature, group):
+        return [(group, signature[i * self.rows:(i + 1) * self.rows].tobytes()) for i in range(self.bands)]
+
+    def add(self, chunk_id, signature, group=None):
+        """Return (representative id, estimated similarity); the id itself if the chunk is kept.
+
+        Only chunks added with an equal `group` are merge candidates.
+        """
+        keys = self._band_keys(signature, group)
+        candidates = set()
+        for table, key in zip(self._buckets, keys):
+            candidates.update(table.get(key, ()))
+
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is not None:
+            self.clusters.setdefault(best, []).append((chunk_id, best_similarity))
+            return best, best_similarity
+
+        for table, key in zip(self._buckets, keys):
+            table.setdefault(key, []).append(chunk_id)
+        self._signatures[chunk_id] = signature
+        return chunk_id, 1.0
+
+    @property
+    def merged(self):
+        return sum(len(members) for members in self.clusters.values())
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from config import Config
+from chunk_schema import iter_chunks
+from embedding_artifacts import file_sha256
+
+
+def with_retry(fn, description, max_retries=Config.PINECONE_MAX_RETRIES, base_delay=0.5, max_delay=30.0):
+    """Call fn, retrying failures with exponential backoff and jitter; re-raise after max_retries."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logging.warning(f"⚠️ {description} failed ({e}); retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def list_index_ids(index):
+    """Every vector id in the index, via the paginated list endpoint (serverless indexes)."""
+    ids = set()
+    for page in index.list():
+        ids.update(page)
+    return ids
+
+
+def load_sync_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_sync_state(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def metadata_hash(metadata):
+    """Short, key-order independent hash of a vector's metadata."""
+    return hashlib.sha256(json.dumps(metadata, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def iter_artifact_vectors(artifact, chunks_path, metadata_fn):
+    """Stream (id, vector, metadata) shard by shard, walking the chunk file in step with the rows."""
+    chunks = iter_chunks(chunks_path)
+    for chunk_ids, rows in artifact.iter_shards(verify=True):
+        for row, cid in enumerate(chunk_ids):
+            chunk = next(chunks, None)
+            if chunk is None or chunk["id"] != cid:
+                raise ValueError(f"{chunks_path} does not line up with {artifact.path} at chunk {cid}")
+            yield cid, rows[row], metadata_fn(chunk)
+
+
+class BoundedSubmitter:
+    """Run tasks on a thread pool with at most `max_in_flight` outstanding, counting failures."""
+
+    def __init__(self, pool, max_in_flight):
+        self.pool = pool
+        self.max_in_flight = max_in_flight
+        self.pending = set()
+        self.failed = 0
+
+    def submit(self, fn, *args):
+        while len(self.pending) >= self.max_in_flight:
+            self._reap(wait(self.pending, return_when=FIRST_COMPLETED).done)
+        self.pending.add(self.pool.submit(fn, *args))
+
+    def drain(self):
+        if self.pending:
+            self._reap(wait(self.pending).done)
+
+    def _reap(self, done):
+        for future in done:
+            self.pending.discard(future)
+            if future.exception() is not None:
+                logging.error(f"❌ Giving up on a batch: {future.exception()}")
+                self.failed += 1
+
+
+def sync_index(index, artifact, chunks_path, metadata_fn, state_path=None, index_name=None,
+               batch_size=Config.PINECONE_UPSERT_BATCH, concurrency=Config.PINECONE_SYNC_CONCURRENCY, dry_run=False):
+    """Make the index hold exactly the artifact's vectors and metadata, sending only the difference.
+
+    Ids are sha256 hashes of the chunk text, so an id already in the index
+    holds the same text; its metadata (source, entity, sections, ...) can
+    still change, so the sync state keeps a hash of every id's metadata and
+    ids whose hash differs (or is unknown) are re-sent. Every vector is
+    re-sent when the artifact's model or revision differs from the one
+    recorded at the last sync.
+    Upserts and deletes run in batches on `concurrency` threads, each with
+    retry and backoff. Vectors are streamed from the shards, so memory is
+    bounded by the batches in flight. Returns a summary dict.
+    """
+    start = time.time()
+    state = load_sync_state(state_path) if state_path else {}
+    remote = with_retry(lambda: list_index_ids(index), "Listing index ids")
+    model = {"index": index_name, "model_id": artifact.model_id, "revision": artifact.manifest.get("revision")}
+    resend_all = bool(remote) and {k: state.get(k) for k in model} != model
+
+    local_hashes = {chunk["id"]: metadata_hash(metadata_fn(chunk)) for chunk in iter_chunks(chunks_path)}
+    local_ids = set(artifact.chunk_ids)
+    if local_ids - local_hashes.keys():
+        raise ValueError(f"{chunks_path} is missing chunks of {artifact.path}")
+    synced_hashes = state.get("metadata_hashes", {})
+    stale = sorted(remote - local_ids)
+    if resend_all:
+        to_send = local_ids
+    else:
+        to_send = {cid for cid in local_ids if cid not in remote or synced_hashes.get(cid) != local_hashes[cid]}
+    summary = {
+        "local": len(local_ids),
+        "remote": len(remote),
+        "upserted": len(to_send),
+        "metadata_changed": len(to_send & remote) if not resend_all else 0,
+        "unchanged": len(local_ids) - len(to_send),
+        "deleted": len(stale),
+        "model_changed": resend_all,
+        "dry_run": dry_run
+    }
+    logging.info(
+        f"🔁 Sync plan: {summary['upserted']} to upsert ({summary['metadata_changed']} for metadata only), "
+        f"{summary['unchanged']} unchanged, {summary['deleted']} stale to delete"
+        f"{' (model changed, resending all)' if resend_all else ''}"
+    )
+    if dry_run:
+        return summary
+
+    def upsert(batch):
+        with_retry(lambda: index.upsert(vectors=batch), f"Upsert of {len(batch)} vectors")
+
+    def delete(ids):
+        with_retry(lambda: index.delete(ids=ids), f"Delete of {len(ids)} vectors")
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="pinecone-sync") as pool:
+        submitter = BoundedSubmitter(pool, concurrency * 2)
+        batch = []
+        for cid, vector, metadata in iter_artifact_vectors(artifact, chunks_path, metadata_fn):
+            if cid not in to_send:
+                continue
+            batch.append((cid, np.asarray(vector, dtype=np.float32).tolist(), metadata))
+            if len(batch) >= batch_size:
+                submitter.submit(upsert, batch)
+                batch = []
+        if batch:
+            submitter.submit(upsert, batch)
+        submitter.drain()
+
+        # Only delete once every upsert is in, so a failed run never leaves chunks missing
+        if not submitter.failed:
+            for i in range(0, len(stale), 1000):
+                submitter.submit(delete, stale[i:i + 1000])
+            submitter.drain()
+
+    summary["failed_batches"] = submitter.failed
+    summary["seconds"] = round(time.time() - start, 2)
+    if submitter.failed:
+        raise RuntimeError(f"{submitter.failed} batches failed after retries; rerun the sync to send the rest")
+    if state_path:
+        metadata_hashes = {cid: local_hashes[cid] for cid in local_ids}
+        artifact_id = file_sha256(artifact.path)[:16]
+        save_sync_state(state_path, {
+            **model,
+            "artifact": artifact.path,
+            "artifact_id": artifact_id,
+            # What the index now serves; services key their caches on it
+            "version": f"{artifact_id}-{metadata_hash(metadata_hashes)}",
+            "synced_at": time.time(),
+            "metadata_hashes": metadata_hashes
+        })
+    logging.info(f"✅ Sync done in {summary['seconds']}s: {summary}")
+    return summary
+
+
+class InMemoryIndex:
+    """Local stand-in for a Pinecone index (upsert, delete, list, describe_index_stats).
+
+    `fail_every` makes every n-th call raise, to exercise the retry path.
+    """
+
+    def __init__(self, fail_every=0):
+        self.vectors = {}
+        self.calls = 0
+        self.fail_every = fail_every
+        self._lock = threading.Lock()
+
+    def _maybe_fail(self):
+        with self._lock:
+            self.calls += 1
+            if self.fail_every and self.calls % self.fail_every == 0:
+                raise ConnectionError("simulated Pinecone failure")
+
+    def upsert(self, vectors):
+        self._maybe_fail()
+        with self._lock:
+            for vid, values, metadata in vectors:
+                self.vectors[vid] = (values, metadata)
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids):
+        self._maybe_fail()
+        with self._lock:
+            for vid in ids:
+                self.vectors.pop(vid, None)
+
+    def list(self, limit=100):
+        ids = sorted(self.vectors)
+        for i in range(0, len(ids), limit):
+            yield ids[i:i + limit]
+
+    def describe_index_stats(self):
+        return {"total_vector_count": len(self.vectors)}
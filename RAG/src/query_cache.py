@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import Config
+
+
+def normalize_query(text):
+    """Cache key text: case-folded with whitespace collapsed."""
+    return " ".join(str(text).lower().split())
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU + TTL cache of query embeddings keyed on (model name, normalized query)."""
+
+    def __init__(self, max_entries=10000, ttl_seconds=86400, persist_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if persist_path and os.path.exists(persist_path):
+            self.load(persist_path)
+
+    def _expired(self, stored_at, now):
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def get(self, text, model_name):
+        key = (model_name, normalize_query(text))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1], now):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, text, model_name, embedding):
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            self._entries[key] = (np.asarray(embedding, dtype=np.float32), time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_encode(self, texts, model_name, encode_fn):
+        """Return embeddings for texts, encoding only the cache misses in one call."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        results = [self.get(text, model_name) for text in texts]
+        missing = [i for i, emb in enumerate(results) if emb is None]
+        if missing:
+            encoded = encode_fn([texts[i] for i in missing])
+            for i, embedding in zip(missing, encoded):
+                self.put(texts[i], model_name, embedding)
+                results[i] = np.asarray(embedding, dtype=np.float32)
+        return np.vstack(results)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+    def save(self, path=None):
+        """Persist live entries so a restarted service does not start cold."""
+        path = path or self.persist_path
+        if not path:
+            return
+        now = time.time()
+        with self._lock:
+            live = [(k, v) for k, v in self._entries.items() if not self._expired(v[1], now)]
+        if not live:
+            return
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            keys=np.array([json.dumps(k) for k, _ in live]),
+            embeddings=np.vstack([v[0] for _, v in live]),
+            stored_at=np.array([v[1] for _, v in live])
+        )
+        os.replace(tmp_path, path)
+        logging.info(f"💾 Saved {len(live)} cached query embeddings to {path}")
+
+    def load(self, path):
+        try:
+            data = np.load(path)
+        except Exception as e:
+            logging.warning(f"Could not load query cache from {path}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for key, embedding, stored_at in zip(data["keys"], data["embeddings"], data["stored_at"]):
+                if not self._expired(float(stored_at), now):
+                    self._entries[tuple(json.loads(str(key)))] = (embedding, float(stored_at))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logging.info(f"📂 Loaded {len(self._entries)} cached query embeddings from {path}")
+
+
+# One cache per process, shared by every service that main.py imports
+query_cache = QueryEmbeddingCache(
+    max_entries=Config.QUERY_CACHE_SIZE,
+    ttl_seconds=Config.QUERY_CACHE_TTL_SECONDS,
+    persist_path=Config.QUERY_CACHE_PATH
+)
+atexit.register(query_cache.save)
@@ -0,0 +1,114 @@
+import time
+import logging
+import threading
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Atomic token bucket: refill by elapsed time, take one token if available.
+# Returns {allowed (0/1), seconds until the next token}.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring((1 - tokens) / rate)}
+"""
+
+
+def parse_rate(limit):
+    """"5/minute" -> (capacity 5, refill rate in tokens per second)."""
+    count, period = limit.split("/")
+    count = int(count)
+    return count, count / PERIODS[period.strip().rstrip("s")]
+
+
+class InMemoryBucketStore:
+    """Per-process token buckets; correct only while a single worker serves the API.
+
+    A bucket left idle long enough to refill completely is indistinguishable
+    from a new one, so such buckets are swept out (at most once per refill
+    period), like the EXPIRE on the Redis keys.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def _evict_idle(self, now, idle_seconds):
+        if now - self._swept_at < idle_seconds:
+            return
+        self._buckets = {
+            key: (tokens, updated) for key, (tokens, updated) in self._buckets.items() if now - updated < idle_seconds
+        }
+        self._swept_at = now
+
+    async def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now, capacity / rate)
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+        return allowed, max(0.0, (1 - tokens) / rate)
+
+
+class RedisBucketStore:
+    """Token buckets kept in Redis, so every worker and host shares the same counters."""
+
+    def __init__(self, url, prefix="ratelimit:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(TOKEN_BUCKET_LUA)
+
+    async def take(self, key, capacity, rate):
+        allowed, retry_after = await self._script(keys=[self.prefix + key], args=[capacity, rate, time.time()])
+        return bool(allowed), max(0.0, float(retry_after))
+
+
+class TokenBucketLimiter:
+    """Token-bucket rate limiter with a shared Redis backend and a local in-memory fallback.
+
+    If Redis is unreachable the limiter keeps serving from the in-memory
+    buckets instead of failing requests, and logs the outage once.
+    """
+
+    def __init__(self, limit, redis_url=None):
+        self.capacity, self.rate = parse_rate(limit)
+        self.local = InMemoryBucketStore()
+        self.shared = RedisBucketStore(redis_url) if redis_url else None
+        self._shared_down = False
+
+    @property
+    def backend(self):
+        return "redis" if self.shared is not None and not self._shared_down else "memory"
+
+    async def allow(self, key):
+        """Take a token for key. Returns (allowed, seconds to wait before retrying)."""
+        if self.shared is not None:
+            try:
+                result = await self.shared.take(key, self.capacity, self.rate)
+                if self._shared_down:
+                    logging.info("✅ Rate-limit backend reachable again, using shared buckets")
+                    self._shared_down = False
+                return result
+            except Exception as e:
+                if not self._shared_down:
+                    logging.warning(f"Rate-limit backend unavailable, falling back to in-memory buckets: {e}")
+                    self._shared_down = True
+        return await self.local.take(key, self.capacity, self.rate)
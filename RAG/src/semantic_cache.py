@@ -0,0 +1,86 @@
+import time
+import threading
+import numpy as np
+from ann_index import normalize_rows
+
+
+class SemanticCache:
+    """Response cache looked up by embedding similarity instead of exact text.
+
+    A query whose embedding is within `threshold` cosine similarity of a
+    cached one gets that entry's stored value. Entries expire after
+    `ttl_seconds`, the least recently used entry is evicted at `max_entries`,
+    and the whole cache is dropped when the index version changes.
+    """
+
+    def __init__(self, dim, threshold=0.97, max_entries=2048, ttl_seconds=600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._embeddings = np.zeros((max_entries, dim), dtype=np.float32)
+        self._values = [None] * max_entries
+        self._stored_at = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)
+        self._size = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._size:
+                self.invalidations += 1
+            self._values = [None] * self.max_entries
+            self._size = 0
+            self._version = version
+
+    def lookup(self, embedding, version):
+        """Return the cached value closest to embedding, or None on a miss."""
+        query = normalize_rows(np.asarray(embedding).reshape(1, -1))[0]
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            if self._size:
+                scores = self._embeddings[:self._size] @ query
+                # Expired entries can never match
+                scores[now - self._stored_at[:self._size] > self.ttl_seconds] = -1.0
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._last_used[best] = now
+                    self.hits += 1
+                    return self._values[best]
+            self.misses += 1
+            return None
+
+    def put(self, embedding, value, version):
+        query = normalize_rows(np.asarray(embedding).reshape(1, -1))[0]
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                # Reuse an expired slot if there is one, otherwise the least recently used
+                expired = np.flatnonzero(now - self._stored_at > self.ttl_seconds)
+                slot = int(expired[0]) if len(expired) else int(np.argmin(self._last_used))
+                self.evictions += 1
+            self._embeddings[slot] = query
+            self._values[slot] = value
+            self._stored_at[slot] = now
+            self._last_used[slot] = now
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
@@ -0,0 +1,131 @@
+import time
+import logging
+import threading
+from datetime import datetime
+from config import Config
+from vector_store import LocalVectorStore, file_fingerprint
+from embedding_artifacts import resolve_artifacts
+from lexical_index import BM25Index
+from chunk_schema import iter_chunks
+
+
+class Snapshot:
+    """Chunks, matrix and indexes that are always served together under one version."""
+
+    def __init__(self, chunks_path, embeddings_path, hybrid=Config.HYBRID_SEARCH):
+        self.chunks_path = chunks_path
+        self.embeddings_path = embeddings_path
+        self.fingerprint = file_fingerprint(chunks_path, embeddings_path)
+        self.version = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}-{self.fingerprint}"
+
+        self.store = LocalVectorStore(chunks_path, embeddings_path)
+        self.lexical_index = BM25Index([chunk["text"] for chunk in iter_chunks(chunks_path)]) if hybrid else None
+        self.loaded_at = time.time()
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "chunks_path": self.chunks_path,
+            "embeddings_path": self.embeddings_path,
+            "chunks": len(self.store.records),
+            "search_mode": self.store.search_mode,
+            "hybrid": self.lexical_index is not None,
+            "loaded_at": datetime.fromtimestamp(self.loaded_at).isoformat()
+        }
+
+
+class SnapshotManager:
+    """Holds the live snapshot and swaps in new ones without stopping the service.
+
+    A replacement snapshot is built on a background thread, then published by
+    a single reference assignment. Requests read `current` once and keep
+    using that snapshot until they finish, so in-flight queries complete on
+    the old version.
+
+    Without explicit paths the manager follows the LATEST embedding artifact,
+    and the watcher switches to a new artifact as soon as LATEST moves.
+    """
+
+    def __init__(self, chunks_path=None, embeddings_path=None):
+        self.follow_latest = chunks_path is None and embeddings_path is None
+        self.chunks_path, self.embeddings_path = resolve_artifacts(chunks_path, embeddings_path)
+        self.current = Snapshot(self.chunks_path, self.embeddings_path)
+        self.loading = False
+        self.last_error = None
+        self._failed_fingerprint = None
+        self._lock = threading.Lock()
+        logging.info(f"📸 Serving snapshot {self.current.version}")
+
+    def reload(self, chunks_path=None, embeddings_path=None):
+        """Start building a new snapshot in the background. Returns False if a reload is already running.
+
+        Without paths, the manager reloads LATEST (when following it) or its
+        current files. Explicit paths pin the manager to them: it stops
+        following LATEST, so the watcher does not revert the reload.
+        """
+        with self._lock:
+            if self.loading:
+                return False
+            self.loading = True
+
+        if chunks_path is not None or embeddings_path is not None:
+            self.follow_latest = False
+        if embeddings_path is not None:
+            # A new artifact brings its own chunk file unless one is given
+            chunks_path, embeddings_path = resolve_artifacts(chunks_path, embeddings_path)
+        elif chunks_path is None and self.follow_latest:
+            chunks_path, embeddings_path = resolve_artifacts()
+        chunks_path = chunks_path or self.chunks_path
+        embeddings_path = embeddings_path or self.embeddings_path
+        threading.Thread(
+            target=self._build_and_swap, args=(chunks_path, embeddings_path), name="snapshot-reload", daemon=True
+        ).start()
+        return True
+
+    def _build_and_swap(self, chunks_path, embeddings_path):
+        fingerprint = None
+        try:
+            start = time.time()
+            fingerprint = file_fingerprint(chunks_path, embeddings_path)
+            snapshot = Snapshot(chunks_path, embeddings_path)
+            previous = self.current
+            self.current = snapshot
+            self.chunks_path, self.embeddings_path = chunks_path, embeddings_path
+            self.last_error = None
+            self._failed_fingerprint = None
+            logging.info(
+                f"🔄 Swapped snapshot {previous.version} -> {snapshot.version} in {round(time.time() - start, 2)}s"
+            )
+        except Exception as e:
+            self.last_error = str(e)
+            self._failed_fingerprint = fingerprint
+            logging.error(f"❌ Snapshot reload failed, still serving {self.current.version}: {e}")
+        finally:
+            self.loading = False
+
+    def watch(self, interval):
+        """Poll the artifact files (and LATEST, when following it) and reload whenever they change."""
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.follow_latest:
+                        latest = resolve_artifacts()
+                        if latest != (self.chunks_path, self.embeddings_path) and not self.loading:
+                            if file_fingerprint(*latest) != self._failed_fingerprint:
+                                logging.info(f"👀 LATEST now points at {latest[1]}, reloading")
+                                self.reload()
+                            continue
+                    fingerprint = file_fingerprint(self.chunks_path, self.embeddings_path)
+                except (OSError, ValueError):
+                    continue  # Files are mid-replacement; check again next tick
+                # Skip files that already failed to load until they change again
+                if fingerprint in (self.current.fingerprint, self._failed_fingerprint) or self.loading:
+                    continue
+                logging.info("👀 Snapshot files changed on disk, reloading")
+                self.reload()
+
+        threading.Thread(target=poll, name="snapshot-watch", daemon=True).start()
+
+    def status(self):
+        return {**self.current.describe(), "reloading": self.loading, "last_error": self.last_error}
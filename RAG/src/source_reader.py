@@ -0,0 +1,139 @@
+import os
+import gzip
+import json
+from config import Config
+
+SOURCE_SUFFIXES = (".json", ".json.gz", ".jsonl", ".jsonl.gz")
+
+
+def is_source_file(name):
+    return name.endswith(SOURCE_SUFFIXES)
+
+
+def open_source(path):
+    """Open a source dump as text, transparently decompressing .gz files."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_json_array(f, buffer_size=1 << 16, path=()):
+    """Yield the elements of a JSON array one at a time.
+
+    The array is the top-level value or, when the top level is an object
+    (e.g. openFDA's {"meta": ..., "results": [...]}), the value reached by
+    following the keys in `path`; members before it are decoded and
+    skipped. Only the current element and the read buffer are held in
+    memory, and reads grow with the element being decoded, so a
+    multi-gigabyte array is parsed in linear time and in memory bounded by
+    the largest single element.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def fill():
+        # Read at least as much as is buffered, so an element spanning many reads is re-decoded O(log n) times
+        nonlocal buffer, pos, eof
+        data = f.read(max(buffer_size, len(buffer) - pos))
+        buffer = buffer[pos:] + data
+        pos = 0
+        if not data:
+            eof = True
+
+    def peek():
+        """Next non-whitespace character, with the cursor moved onto it; "" at EOF."""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if eof:
+                return ""
+            fill()
+
+    def decode_value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # A number cut at the buffer edge decodes early ("1" of "1.5"), so only accept a value once
+            # the delimiter after it has been read
+            rest = end
+            while rest < len(buffer) and buffer[rest].isspace():
+                rest += 1
+            if rest < len(buffer) and buffer[rest] in ",]}:":
+                pos = end
+                return value
+            if eof:
+                if rest == len(buffer):
+                    pos = end
+                    return value
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, rest)
+            fill()
+
+    def expect(char):
+        nonlocal pos
+        found = peek()
+        if found != char:
+            raise ValueError(f"expected {char!r} in JSON source, found {found or 'end of input'!r}")
+        pos += 1
+
+    keys = list(path)
+    while peek() == "{":
+        if not keys:
+            raise ValueError("expected a JSON array; pass the key path of the array inside the top-level object")
+        pos += 1
+        target = keys.pop(0)
+        while True:
+            if peek() in ("}", ""):
+                raise ValueError(f"key {target!r} not found in JSON source")
+            key = decode_value()
+            expect(":")
+            if key == target:
+                break
+            decode_value()
+            if peek() == ",":
+                pos += 1
+
+    expect("[")
+    while True:
+        char = peek()
+        if char == "]":
+            return
+        if char == "":
+            raise ValueError("unterminated JSON array")
+        if char == ",":
+            pos += 1
+            continue
+        yield decode_value()
+
+
+def iter_jsonl(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_records(path, array_path=Config.SOURCE_ARRAY_PATH):
+    """Stream records from a .json / .jsonl source, optionally gzipped.
+
+    `array_path` is the dotted key path of the record array in object-shaped
+    .json dumps (e.g. "results" for openFDA); top-level arrays ignore it.
+    """
+    with open_source(path) as f:
+        if path.endswith((".jsonl", ".jsonl.gz")):
+            yield from iter_jsonl(f)
+        else:
+            yield from iter_json_array(f, path=tuple(array_path.split(".")) if array_path else ())
+
+
+def list_sources(data_dir):
+    return sorted(os.path.join(data_dir, name) for name in os.listdir(data_dir) if is_source_file(name))
@@ -4,6 +4,8 @@ import torch.optim as optim
 from neo4j import GraphDatabase
 import argparse
 import json
+import time
+import hashlib
 from dotenv import load_dotenv
 import os
 
@@ -35,6 +37,10 @@ class TransE(nn.Module):
     def forward(self, h, r, t):
         return -torch.norm(self.entity_embedding(h) + self.relation_embedding(r) - self.entity_embedding(t), p=1, dim=1)
 
+def description_hash(text):
+    """Key of a Description node; texts can exceed the index key size, so nodes are merged on their sha256."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
 # ====== Custom Neo4j Insert Logic (NoGAN) ======
 def insert_triples(tx, disease):
     tx.run("MERGE (d:Disease {name: $name}) SET d.description = $description",
@@ -72,10 +78,156 @@ def insert_triples(tx, disease):
         MERGE (d)-[:TREATED_BY]->(dr)
         """, name=disease["name"], drug=drug)
         tx.run("""
-        MERGE (desc:Description {text: $desc})
+        MERGE (desc:Description {hash: $hash}) SET desc.text = $desc
         MERGE (dr:Drug {name: $drug})
         MERGE (dr)-[:HAS_DESCRIPTION]->(desc)
-        """, drug=drug, desc=desc)
+        """, drug=drug, desc=desc, hash=description_hash(desc))
+
+# ====== Bulk Loader (UNWIND batches) ======
+BULK_BATCH_SIZE = 10000
+
+# Property each label is merged on
+NODE_KEYS = {
+    "Disease": "name",
+    "Symptom": "name",
+    "Cause": "name",
+    "Precaution": "name",
+    "Drug": "name",
+    "Description": "hash"
+}
+
+# (relationship, source label, target label), loaded after all nodes exist
+RELATIONSHIPS = [
+    ("HAS_SYMPTOM", "Disease", "Symptom"),
+    ("HAS_CAUSE", "Disease", "Cause"),
+    ("HAS_PRECAUTION", "Disease", "Precaution"),
+    ("TREATED_BY", "Disease", "Drug"),
+    ("HAS_DESCRIPTION", "Drug", "Description")
+]
+
+SCHEMA_STATEMENTS = [
+    f"CREATE CONSTRAINT {label.lower()}_{key} IF NOT EXISTS FOR (n:{label}) REQUIRE n.{key} IS UNIQUE"
+    for label, key in NODE_KEYS.items()
+] + [
+    # Equality MERGE/MATCH never used the old text index on Description.text
+    "DROP INDEX description_text IF EXISTS"
+]
+
+def node_key(label, value):
+    """Value a node of `label` is merged on: the name itself, or the hash of a description text."""
+    return description_hash(value) if NODE_KEYS[label] == "hash" else value
+
+def backfill_description_hashes(session):
+    """Give Description nodes from older loads (merged on their text) the hash they are now keyed on."""
+    rows = [
+        {"id": record["id"], "hash": description_hash(record["text"])}
+        for record in session.run(
+            "MATCH (n:Description) WHERE n.hash IS NULL RETURN elementId(n) AS id, n.text AS text"
+        )
+    ]
+    if rows:
+        run_unwind(session, "Description hash backfill",
+                   "UNWIND $rows AS row MATCH (n:Description) WHERE elementId(n) = row.id SET n.hash = row.hash", rows)
+
+def create_schema(session):
+    """Create the uniqueness constraints and indexes that back every MERGE/MATCH, and wait until they are online."""
+    backfill_description_hashes(session)
+    for statement in SCHEMA_STATEMENTS:
+        session.run(statement).consume()
+    session.run("CALL db.awaitIndexes()").consume()
+
+def collect_rows(data):
+    """Disease descriptions plus deduplicated (source, target) pairs per relationship, same graph as insert_triples."""
+    diseases = {}
+    edges = {rel: set() for rel, _, _ in RELATIONSHIPS}
+    for disease in data:
+        name = disease["name"]
+        diseases[name] = disease.get("description")
+        for symptom in disease.get("symptoms", "").split(","):
+            if symptom.strip():
+                edges["HAS_SYMPTOM"].add((name, symptom.strip()))
+        if disease.get("cause"):
+            edges["HAS_CAUSE"].add((name, disease["cause"]))
+        for precaution in disease.get("precautions", "").split(","):
+            if precaution.strip():
+                edges["HAS_PRECAUTION"].add((name, precaution.strip()))
+        for drug, desc in disease.get("drug_descriptions", {}).items():
+            edges["TREATED_BY"].add((name, drug))
+            edges["HAS_DESCRIPTION"].add((drug, desc))
+    return diseases, edges
+
+def run_unwind(session, step, query, rows, batch_size=BULK_BATCH_SIZE):
+    """Send rows as $rows in UNWIND batches, one write transaction per batch. Returns (rows, seconds)."""
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        session.execute_write(lambda tx: tx.run(query, rows=batch).consume())
+    elapsed = time.perf_counter() - start
+    print(f"[BULK 📦] {step}: {len(rows)} rows in {elapsed:.2f}s ({len(rows) / max(elapsed, 1e-9):.0f} rows/s)")
+    return len(rows), elapsed
+
+def bulk_load(data, batch_size=BULK_BATCH_SIZE):
+    """Load the direct-insertion graph with constraints first, then nodes per label, then edges per relationship."""
+    diseases, edges = collect_rows(data)
+    steps = [(
+        "Disease nodes",
+        "UNWIND $rows AS row MERGE (d:Disease {name: row.name}) SET d.description = row.description",
+        [{"name": name, "description": description} for name, description in diseases.items()]
+    )]
+    for label, key in NODE_KEYS.items():
+        if label == "Disease":
+            continue
+        values = sorted({target for rel, _, dst in RELATIONSHIPS if dst == label for _, target in edges[rel]})
+        if key == "hash":
+            steps.append((
+                f"{label} nodes",
+                f"UNWIND $rows AS row MERGE (n:{label} {{hash: row.hash}}) SET n.text = row.text",
+                [{"hash": description_hash(value), "text": value} for value in values]
+            ))
+        else:
+            steps.append((f"{label} nodes", f"UNWIND $rows AS value MERGE (:{label} {{{key}: value}})", values))
+    for rel, src, dst in RELATIONSHIPS:
+        steps.append((
+            rel,
+            f"""
+            UNWIND $rows AS row
+            MATCH (a:{src} {{{NODE_KEYS[src]}: row.source}})
+            MATCH (b:{dst} {{{NODE_KEYS[dst]}: row.target}})
+            MERGE (a)-[:{rel}]->(b)
+            """,
+            [{"source": node_key(src, source), "target": node_key(dst, target)}
+             for source, target in sorted(edges[rel])]
+        ))
+
+    total_rows, start = 0, time.perf_counter()
+    with driver.session() as session:
+        create_schema(session)
+        for step, query, rows in steps:
+            total_rows += run_unwind(session, step, query, rows, batch_size)[0]
+    elapsed = time.perf_counter() - start
+    print(f"[BULK ✅] {total_rows} rows in {elapsed:.2f}s ({total_rows / max(elapsed, 1e-9):.0f} rows/s)")
+
+def bulk_insert_triples(triples, infer_type, batch_size=BULK_BATCH_SIZE):
+    """UNWIND the GAN-accepted triples, one batched query per (head label, relationship, tail label)."""
+    groups = {}
+    for h, r, t in triples:
+        h_type, t_type = infer_type(h), infer_type(t)
+        is_description = r == "has_description"
+        row = {"h": h, "t": description_hash(t), "text": t} if is_description else {"h": h, "t": t}
+        groups.setdefault((h_type, r.upper(), t_type, is_description), []).append(row)
+
+    with driver.session() as session:
+        create_schema(session)
+        for (h_type, rel, t_type, is_description), rows in groups.items():
+            merge_tail = (f"MERGE (b:{t_type} {{hash: row.t}}) SET b.text = row.text" if is_description
+                          else f"MERGE (b:{t_type} {{name: row.t}})")
+            query = f"""
+            UNWIND $rows AS row
+            MERGE (a:{h_type} {{name: row.h}})
+            {merge_tail}
+            MERGE (a)-[:{rel}]->(b)
+            """
+            run_unwind(session, f"{h_type} -[{rel}]-> {t_type}", query, rows, batch_size)
 
 # ====== Load Triples for GAN Mode ======
 def load_triples():
@@ -99,10 +251,13 @@ def load_triples():
     return triples, data
 
 # ====== Build KG ======
-def build_kg(train_gan=True):
+def build_kg(train_gan=True, bulk=False, batch_size=BULK_BATCH_SIZE):
     triples, original_data = load_triples()
 
     if not train_gan:
+        if bulk:
+            bulk_load(original_data, batch_size)
+            return
         with driver.session() as session:
             for d in original_data:
                 session.execute_write(insert_triples, d)
@@ -195,6 +350,11 @@ def build_kg(train_gan=True):
             return "Drug"
         return "Disease"
 
+    if bulk:
+        bulk_insert_triples(refined_triples, infer_type, batch_size)
+        print("\n🔹 Knowledge graph construction completed.")
+        return
+
     with driver.session() as session:
         for h, r, t in refined_triples:
             h_type = infer_type(h)
@@ -203,9 +363,9 @@ def build_kg(train_gan=True):
                 session.run(
                     f"""
                     MERGE (a:{h_type} {{name: $h}})
-                    MERGE (b:{t_type} {{text: $t}})
+                    MERGE (b:{t_type} {{hash: $hash}}) SET b.text = $t
                     MERGE (a)-[:{r.upper()}]->(b)
-                    """, {"h": h, "t": t}
+                    """, {"h": h, "t": t, "hash": description_hash(t)}
                 )
             else:
                 session.run(
@@ -222,6 +382,8 @@ def build_kg(train_gan=True):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--gan", action="store_true", help="Enable GAN filtering before inserting into Neo4j")
+    parser.add_argument("--bulk", action="store_true", help="Load with batched UNWIND transactions")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE, help="Rows per UNWIND transaction")
     args = parser.parse_args()
 
     if args.gan:
@@ -229,4 +391,4 @@ if __name__ == "__main__":
     else:
         print("[MODE: DIRECT INSERTION 🚫 GAN]")
 
-    build_kg(train_gan=args.gan)
+    build_kg(train_gan=args.gan, bulk=args.bulk, batch_size=args.batch_size)
@@ -1,11 +1,13 @@
 import os
-import json
-import numpy as np
 import logging
-import hashlib
+import argparse
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
 from time import time
+from config import Config
+from chunk_schema import METADATA_FIELDS
+from embedding_artifacts import EmbeddingArtifact, is_artifact, resolve_artifacts
+from chunk_text_store import ChunkTextStore
+from pinecone_sync import sync_index, InMemoryIndex
 
 # Load .env variables
 load_dotenv()
@@ -21,67 +23,75 @@ logging.basicConfig(
 )
 
 # Constants
-INDEX_NAME = "medical-rag-index"
+INDEX_NAME = Config.PINECONE_INDEX_NAME
 EMBEDDING_DIM = 768
-CHUNKS_FILE = "./RAG/chunks/20250804_221234_chunks.json"
-EMBEDDINGS_FILE = "./RAG/embeddings/20250804_221349_embeddings.npy"
 
-# Initialize Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index_names = pc.list_indexes().names()
+def get_index(index_name=INDEX_NAME):
+    """Connect to Pinecone and return the index, creating it on first use."""
+    from pinecone import Pinecone, ServerlessSpec
 
-if INDEX_NAME not in index_names:
-    logging.info(f"🆕 Creating Pinecone index: {INDEX_NAME}")
-    pc.create_index(
-        name=INDEX_NAME,
-        dimension=EMBEDDING_DIM,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"), pool_threads=Config.PINECONE_SYNC_CONCURRENCY)
+    index_names = pc.list_indexes().names()
 
-index = pc.Index(INDEX_NAME)
+    if index_name not in index_names:
+        logging.info(f"🆕 Creating Pinecone index: {index_name}")
+        pc.create_index(
+            name=index_name,
+            dimension=EMBEDDING_DIM,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region="us-east-1")
+        )
 
-# Generate unique ID based on content hash
-def generate_id(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return pc.Index(index_name, pool_threads=Config.PINECONE_SYNC_CONCURRENCY)
 
-# Batch upsert to Pinecone
-def batch_upsert(vectors, batch_size=100):
-    for i in range(0, len(vectors), batch_size):
-        batch = vectors[i:i + batch_size]
-        try:
-            index.upsert(vectors=batch)
-            logging.info(f"📤 Upserted batch {i}–{i + len(batch)}")
-        except Exception as e:
-            logging.error(f"❌ Failed batch {i}–{i + len(batch)}: {e}")
+# Only the small filterable chunk fields go to Pinecone (it rejects nulls); texts stay in the chunk text store
+def chunk_metadata(chunk):
+    return {field: chunk[field] for field in METADATA_FIELDS if chunk.get(field) is not None}
 
 # Main function
-def upsert_to_pinecone():
-    try:
-        with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
-            chunks = json.load(f)
-
-        embeddings = np.load(EMBEDDINGS_FILE)
-
-        if len(chunks) != len(embeddings):
-            raise ValueError(f"Mismatch: {len(chunks)} chunks vs {len(embeddings)} embeddings")
+def upsert_to_pinecone(embeddings_path=None, index=None, dry_run=False, state_path=Config.PINECONE_SYNC_STATE):
+    """Diff-sync the index with an embedding artifact (LATEST by default).
 
-        vectors = [
-            (generate_id(chunks[i]), embeddings[i].tolist(), {"text": chunks[i]})
-            for i in range(len(chunks))
-        ]
-
-        logging.info(f"🔢 Preparing to upsert {len(vectors)} vectors to Pinecone...")
+    Only vectors whose ids the index does not hold yet are upserted and ids
+    that are no longer in the artifact are deleted; see pinecone_sync.sync_index.
+    """
+    try:
+        # The artifact names its own chunk file
+        chunks_path, embeddings_path = resolve_artifacts(embeddings_path=embeddings_path)
+        if not is_artifact(embeddings_path):
+            raise ValueError(f"No sharded embedding artifact found (got {embeddings_path}); run generate_embeddings")
+        artifact = EmbeddingArtifact(embeddings_path)
+
+        # Texts go in first, so every id the index returns can be resolved
+        text_store = ChunkTextStore()
+        logging.info(f"📝 Chunk text store holds {text_store.add_chunk_file(chunks_path)} chunks of {chunks_path}")
+
+        index = index if index is not None else get_index()
+        logging.info(f"🔢 Syncing {artifact.rows} vectors from {embeddings_path} to Pinecone...")
         start = time()
-        batch_upsert(vectors)
-        logging.info(f"✅ All vectors upserted in {round(time() - start, 2)}s")
+        summary = sync_index(
+            index, artifact, chunks_path, chunk_metadata, state_path=state_path, index_name=INDEX_NAME, dry_run=dry_run
+        )
+        # No pruning here: local stores may still serve other artifacts from the same text store.
+        # Old texts are dropped explicitly with chunk_text_store.py --prune.
+        text_store.close()
+        logging.info(f"✅ Sync finished in {round(time() - start, 2)}s")
 
         # Optional: Log index stats
         stats = index.describe_index_stats()
         logging.info(f"📦 Total vectors in Pinecone: {stats['total_vector_count']}")
+        return summary
 
     except Exception as e:
-        logging.error(f"❌ Error during upsert: {str(e)}")
+        logging.error(f"❌ Error during sync: {str(e)}")
 
 if __name__ == "__main__":
-    upsert_to_pinecone()
+    parser = argparse.ArgumentParser(description="Sync a sharded embedding artifact to Pinecone")
+    parser.add_argument("--artifact", default=None, help="Artifact manifest or directory (default: LATEST)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be upserted and deleted")
+    parser.add_argument("--mock", action="store_true", help="Sync into an in-memory index instead of Pinecone")
+    args = parser.parse_args()
+    if args.mock:
+        upsert_to_pinecone(args.artifact, index=InMemoryIndex(), dry_run=args.dry_run, state_path=None)
+    else:
+        upsert_to_pinecone(args.artifact, dry_run=args.dry_run)
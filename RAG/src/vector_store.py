@@ -0,0 +1,271 @@
+import os
+import time
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+import numpy as np
+from langchain_core.documents import Document
+from config import Config
+from ann_index import load_or_build_index, top_k_indices
+from embedding_matrix import load_normalized_matrix, cosine_scores
+from chunk_schema import iter_chunks, matches, METADATA_FIELDS, LIST_FIELDS
+from chunk_text_store import ChunkTextStore
+from pinecone_sync import load_sync_state
+from embedding_artifacts import EmbeddingArtifact, is_artifact, resolve_artifacts
+
+
+def file_fingerprint(*paths):
+    """Cheap change detector over file sizes and modification times."""
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:12]
+
+
+def open_text_store(path=Config.CHUNK_TEXT_STORE_PATH):
+    """The chunk text store opened read-only, or None if no offline job has written it yet."""
+    try:
+        return ChunkTextStore(path, readonly=True)
+    except FileNotFoundError:
+        return None
+
+
+class VectorStore(ABC):
+    """Backend searched by chunk_api.rag_query and embeddings_api."""
+
+    name = "base"
+
+    @abstractmethod
+    def current_version(self):
+        """Identifier that changes whenever the indexed content changes (used to invalidate caches)."""
+
+    @abstractmethod
+    def similarity_search_by_vector(self, embedding, k=3, filter=None):
+        """Return the k closest chunks as LangChain Documents.
+
+        `filter` restricts the search to chunks whose metadata fields (source,
+        entity, sections, token_count) match, e.g. {"entity": "Asthma"} or
+        {"sections": ["treatment", "drugs"]} (chunks covering either section).
+        """
+
+    def similarity_search_with_vectors(self, embedding, k=3, filter=None):
+        """Like similarity_search_by_vector, plus the stored vectors of the hits (None if unavailable)."""
+        return self.similarity_search_by_vector(embedding, k=k, filter=filter), None
+
+
+def pinecone_filter(filter):
+    """Translate a chunk-field filter into Pinecone's metadata filter syntax.
+
+    `$in` matches a list-valued field (sections) when any of its values is in the given ones.
+    """
+    if not filter:
+        return None
+    return {
+        field: {"$in": list(value)} if isinstance(value, (list, tuple, set))
+        else {"$in": [value]} if field in LIST_FIELDS else {"$eq": value}
+        for field, value in filter.items()
+    }
+
+
+def match_metadata(match):
+    metadata = match.get("metadata") or {}
+    return {
+        "id": match["id"],
+        "score": match["score"],
+        **{field: metadata[field] for field in METADATA_FIELDS if field in metadata}
+    }
+
+
+class PineconeStore(VectorStore):
+    """Remote Pinecone index holding chunk ids and the small filterable fields.
+
+    Hit texts are resolved through the local chunk text store, so query
+    responses carry no chunk text. Startup fails unless the store holds a
+    text for every id recorded in the last sync state (listing the index
+    itself would take one request per 100 vectors). One client and index
+    handle are shared by every request, so queries reuse pooled keep-alive
+    HTTP connections instead of opening new ones.
+    """
+
+    name = "pinecone"
+
+    def __init__(self, index_name=Config.PINECONE_INDEX_NAME, text_store=None, state_path=Config.PINECONE_SYNC_STATE):
+        from pinecone import Pinecone
+
+        if not Config.PINECONE_API_KEY:
+            raise ValueError("PINECONE_API_KEY environment variable is required for the pinecone backend")
+        client = Pinecone(api_key=Config.PINECONE_API_KEY, pool_threads=Config.PINECONE_POOL_SIZE)
+        self.index = client.Index(
+            index_name,
+            pool_threads=Config.PINECONE_POOL_SIZE,
+            connection_pool_maxsize=Config.PINECONE_POOL_SIZE
+        )
+        self.text_store = text_store or ChunkTextStore(readonly=True)
+        self.index_name = index_name
+        self.state_path = state_path
+        state = load_sync_state(state_path)
+        if state.get("index") == index_name and state.get("metadata_hashes"):
+            self.text_store.require(list(state["metadata_hashes"]), f"Pinecone index {index_name}")
+        else:
+            logging.warning(
+                f"⚠️ No sync state for {index_name} in {state_path}; hits without a stored text are skipped"
+            )
+        self._version = None
+        self._version_checked_at = 0.0
+
+    def current_version(self):
+        # Pinecone has no content version; store_in_pinecone records one for the artifact
+        # (and metadata) it synced, which is re-read periodically
+        if time.time() - self._version_checked_at > Config.VECTOR_STORE_VERSION_CHECK_SECONDS:
+            try:
+                state = load_sync_state(self.state_path)
+                if state.get("index") == self.index_name and state.get("version"):
+                    self._version = f"pinecone-{state['version']}"
+                else:
+                    # Synced before versions were recorded; the vector count is the best proxy left
+                    stats = self.index.describe_index_stats()
+                    self._version = f"pinecone-count-{stats['total_vector_count']}"
+            except Exception as e:
+                logging.warning(f"Could not refresh the Pinecone index version: {e}")
+            self._version_checked_at = time.time()
+        return self._version
+
+    def query(self, embedding, k, filter=None, include_values=False):
+        """(match, text) pairs of the k closest vectors; matches whose text cannot be resolved are dropped."""
+        response = self.index.query(
+            vector=list(map(float, embedding)), top_k=k, filter=pinecone_filter(filter),
+            include_values=include_values, include_metadata=True
+        )
+        matches = response["matches"]
+        texts = self.text_store.get_many([m["id"] for m in matches])
+        hits = []
+        for match, text in zip(matches, texts):
+            # Vectors synced before the text store still carry their text in metadata
+            text = text or (match.get("metadata") or {}).get("text")
+            if text is None:
+                # Only ids upserted after startup can be missing; the sync writes texts before vectors
+                logging.error(f"❌ Chunk {match['id']} is not in the chunk text store, skipping it")
+                continue
+            hits.append((match, text))
+        return hits
+
+    def similarity_search_by_vector(self, embedding, k=3, filter=None):
+        return [
+            Document(page_content=text, metadata=match_metadata(match))
+            for match, text in self.query(embedding, k, filter=filter)
+        ]
+
+    def similarity_search_with_vectors(self, embedding, k=3, filter=None):
+        hits = self.query(embedding, k, filter=filter, include_values=True)
+        documents = [Document(page_content=text, metadata=match_metadata(match)) for match, text in hits]
+        vectors = np.asarray([match["values"] for match, _ in hits], dtype=np.float32) if hits else None
+        return documents, vectors
+
+
+class LocalVectorStore(VectorStore):
+    """In-process store over the chunks/embeddings artifacts from generate_chunks and generate_embeddings."""
+
+    name = "local"
+
+    def __init__(self, chunks_path=None, embeddings_path=None, dtype=Config.EMBEDDINGS_DTYPE,
+                 search_mode=Config.SEARCH_MODE, text_store=None):
+        # Unset paths resolve to the LATEST sharded artifact (or the legacy Config files)
+        chunks_path, embeddings_path = resolve_artifacts(chunks_path, embeddings_path)
+        self.version = f"local-{file_fingerprint(chunks_path, embeddings_path)}"
+        # Rows keep only the chunk id and metadata fields; texts live in the chunk text store
+        self.records = [
+            {field: chunk.get(field) for field in ("id",) + METADATA_FIELDS} for chunk in iter_chunks(chunks_path)
+        ]
+        # Written by generate_embeddings / store_in_pinecone; serving only reads it. Texts the
+        # store lacks (or all of them, without a store) are kept in memory from the chunk file.
+        self.text_store = text_store or open_text_store()
+        ids = [record["id"] for record in self.records]
+        missing = set(self.text_store.missing(ids) if self.text_store is not None else ids)
+        self.local_texts = {}
+        if missing:
+            self.local_texts = {
+                chunk["id"]: chunk["text"] for chunk in iter_chunks(chunks_path) if chunk["id"] in missing
+            }
+            logging.info(f"📝 {len(missing)} chunk texts not in the chunk text store, keeping them in memory")
+        if is_artifact(embeddings_path):
+            EmbeddingArtifact(embeddings_path).check_alignment([record["id"] for record in self.records])
+        self.embeddings = load_normalized_matrix(embeddings_path, dtype)
+        if len(self.records) != len(self.embeddings):
+            raise ValueError(f"Mismatch: {len(self.records)} chunks vs {len(self.embeddings)} embeddings")
+
+        self.ann_index = None
+        if search_mode == "approximate":
+            self.ann_index = load_or_build_index(
+                self.embeddings, embeddings_path, nlist=Config.ANN_NLIST, nprobe=Config.ANN_NPROBE
+            )
+        logging.info(f"📦 Local vector store ready: {len(self.records)} chunks ({self.search_mode} search)")
+
+    @property
+    def search_mode(self):
+        return "approximate" if self.ann_index is not None else "exact"
+
+    def current_version(self):
+        return self.version
+
+    def texts(self, rows):
+        """Chunk texts of the given rows, from memory or the chunk text store."""
+        ids = [self.records[i]["id"] for i in rows]
+        stored = self.text_store.get_many(ids) if self.text_store is not None else [None] * len(ids)
+        return [self.local_texts.get(cid, text) for cid, text in zip(ids, stored)]
+
+    def filter_rows(self, filter):
+        """Row numbers of the chunks whose metadata matches `filter`."""
+        return np.asarray([i for i, record in enumerate(self.records) if matches(record, filter)], dtype=np.int64)
+
+    def exact_search(self, query_embedding, top_k, filter=None):
+        if filter:
+            rows = self.filter_rows(filter)
+            if not len(rows):
+                return rows, np.zeros(0, dtype=np.float32)
+            similarities = cosine_scores(self.embeddings[rows], query_embedding)
+            best = top_k_indices(similarities, top_k)
+            return rows[best], similarities[best]
+        similarities = cosine_scores(self.embeddings, query_embedding)
+        indices = top_k_indices(similarities, top_k)
+        return indices, similarities[indices]
+
+    def search(self, query_embedding, top_k, filter=None):
+        """Search with the ANN index when it is enabled, otherwise scan the whole matrix.
+
+        Filtered searches always scan exactly, over the matching rows only.
+        """
+        if self.ann_index is not None and not filter:
+            return self.ann_index.search(self.embeddings, query_embedding, top_k)
+        return self.exact_search(query_embedding, top_k, filter=filter)
+
+    def document(self, idx, score, text):
+        metadata = {"index": int(idx), "score": float(score), **self.records[idx]}
+        return Document(page_content=text, metadata=metadata)
+
+    def similarity_search_by_vector(self, embedding, k=3, filter=None):
+        indices, scores = self.search(embedding, k, filter=filter)
+        documents = []
+        for idx, score, text in zip(indices, scores, self.texts(indices)):
+            if text is None:
+                # Only texts pruned from the store after startup can be missing
+                logging.error(f"❌ Chunk {self.records[idx]['id']} is not in the chunk text store, skipping it")
+                continue
+            documents.append(self.document(idx, score, text))
+        return documents
+
+    def similarity_search_with_vectors(self, embedding, k=3, filter=None):
+        documents = self.similarity_search_by_vector(embedding, k=k, filter=filter)
+        rows = [doc.metadata["index"] for doc in documents]
+        if not rows:
+            return documents, None
+        return documents, np.asarray(self.embeddings[rows], dtype=np.float32)
+
+
+def create_vector_store(backend=Config.VECTOR_STORE_BACKEND):
+    """Build the configured vector-store backend ("pinecone" or "local")."""
+    if backend == "pinecone":
+        return PineconeStore()
+    if backend == "local":
+        return LocalVectorStore()
+    raise ValueError(f"Unknown vector store backend: {backend}")
@@ -0,0 +1,15 @@
+from chunk_schema import make_chunk, matches
+
+
+def test_list_field_matches_any_covered_section():
+    chunk = make_chunk("Disease: Flu. ...", entity="Flu", sections=["overview", "symptoms", "treatment"])
+    assert matches(chunk, {"sections": ["treatment", "drugs"]})
+    assert matches(chunk, {"sections": "symptoms"})
+    assert not matches(chunk, {"sections": ["drugs"]})
+
+
+def test_scalar_fields_still_match_exactly():
+    chunk = make_chunk("Disease: Flu. ...", entity="Flu", sections=["overview"])
+    assert matches(chunk, {"entity": "Flu"})
+    assert matches(chunk, {"entity": ["Cold", "Flu"]})
+    assert not matches(chunk, {"entity": "Cold"})
@@ -0,0 +1,32 @@
+import time
+
+from feedback_writer import FeedbackWriter
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def test_close_flushes_queued_records(tmp_path):
+    path = tmp_path / "feedback.jsonl"
+    writer = FeedbackWriter(str(path), flush_interval=0.1)
+    for i in range(25):
+        writer.submit({"i": i})
+    writer.close()
+    assert len(read_lines(path)) == 25 and not writer._thread.is_alive()
+
+
+def test_close_does_not_block_on_full_queue(tmp_path):
+    path = tmp_path / "feedback.jsonl"
+    writer = FeedbackWriter(str(path), batch_size=1, flush_interval=0.1, max_queue=2)
+    write = writer._write
+    writer._write = lambda batch: (time.sleep(0.2), write(batch))
+    while writer.submit({"i": 0}):
+        pass
+
+    start = time.monotonic()
+    writer.close(timeout=5)
+    assert time.monotonic() - start < 2
+    assert not writer._thread.is_alive()
+    assert len(read_lines(path)) == writer.written
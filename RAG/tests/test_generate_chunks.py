@@ -0,0 +1,131 @@
+import itertools
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import generate_chunks
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word; stands in for the BioBERT tokenizer."""
+
+    def encode(self, text, add_special_tokens=False):
+        return text.split()
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+
+@pytest.fixture(autouse=True)
+def word_tokenizer(monkeypatch):
+    monkeypatch.setattr(generate_chunks, "_tokenizer", WordTokenizer())
+
+
+DISEASE = {
+    "name": "Flu",
+    "description": "A contagious respiratory illness.",
+    "symptoms": "fever, cough",
+    "treatment": "rest and fluids",
+}
+
+
+def test_packed_chunk_lists_every_section_it_covers():
+    chunks = generate_chunks.build_chunks(DISEASE, "diseases.json")
+    assert len(chunks) == 1
+    assert chunks[0]["sections"] == ["overview", "symptoms", "treatment"]
+
+
+def test_split_chunks_list_their_own_sections(monkeypatch):
+    monkeypatch.setattr(generate_chunks.Config, "CHUNK_MAX_TOKENS", 12)
+    chunks = generate_chunks.build_chunks(DISEASE, "diseases.json")
+    assert len(chunks) > 1
+    assert chunks[0]["sections"][0] == "overview"
+    assert [s for chunk in chunks for s in chunk["sections"]].count("treatment") == 1
+    assert all(chunk["text"].startswith("Disease: Flu.") for chunk in chunks)
+
+
+def test_previous_chunks_are_read_back_by_id(tmp_path):
+    chunks = generate_chunks.build_chunks(DISEASE, "diseases.json") + \
+        generate_chunks.build_chunks({"name": "Aspirin", "description": "Pain reliever."}, "drugs.json")
+    path = tmp_path / "previous_chunks.jsonl"
+    path.write_text("".join(json.dumps(chunk) + "\n" for chunk in chunks), encoding="utf-8")
+
+    previous = generate_chunks.PreviousChunks(str(path))
+    assert previous[chunks[1]["id"]] == chunks[1]
+    assert previous[chunks[0]["id"]] == chunks[0]
+    assert "missing" not in previous
+    previous.close()
+    assert "anything" not in generate_chunks.PreviousChunks()
+
+
+def drug(name, description):
+    return {"name": name, "description": description}
+
+
+def run_chunking(tmp_path, records, monkeypatch):
+    """One incremental load_and_chunk run over `records`; returns (build_chunks calls, manifest, delta)."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir(exist_ok=True)
+    (data_dir / "drugs.json").write_text(json.dumps(records), encoding="utf-8")
+    built = []
+    build_chunks = generate_chunks.build_chunks
+
+    def counting(item, source):
+        built.append(item)
+        return build_chunks(item, source)
+
+    monkeypatch.setattr(generate_chunks, "build_chunks", counting)
+    generate_chunks.load_and_chunk(str(data_dir), manifest_path=str(tmp_path / "manifest.json"), workers=1,
+                                   near_dedup=False)
+    manifest = json.loads((tmp_path / "manifest.json").read_text(encoding="utf-8"))
+    with open(manifest["delta"], encoding="utf-8") as f:
+        delta = json.load(f)
+    return built, manifest, delta
+
+
+@pytest.fixture
+def chunk_dir(tmp_path, monkeypatch):
+    """Run in tmp_path (outputs go to ./RAG/chunks) with a distinct timestamp per run."""
+    monkeypatch.chdir(tmp_path)
+    clock = itertools.count()
+    start = datetime(2025, 1, 1)
+
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return start + timedelta(seconds=next(clock))
+
+    monkeypatch.setattr(generate_chunks, "datetime", Clock)
+    return tmp_path
+
+
+def test_incremental_run_reuses_unchanged_records_and_writes_delta(chunk_dir, monkeypatch):
+    records = [drug(f"Drug {i}", f"Treats condition number {i}.") for i in range(5)]
+    built, first, delta = run_chunking(chunk_dir, records, monkeypatch)
+    assert len(built) == 5 and len(delta["added"]) == 5 and delta["removed"] == []
+
+    # Insert a record at the front, edit one and delete another
+    edited = drug("Drug 2", "Treats condition number 2 and more.")
+    updated = [drug("Drug 9", "A new drug.")] + records[:2] + [edited, records[3]]
+    built, second, delta = run_chunking(chunk_dir, updated, monkeypatch)
+
+    assert [item["name"] for item in built] == ["Drug 9", "Drug 2"]
+    for key in ("drugs.json#Drug 0", "drugs.json#Drug 1", "drugs.json#Drug 3"):
+        assert second["records"][key]["chunk_ids"] == first["records"][key]["chunk_ids"]
+    assert "drugs.json#Drug 4" not in second["records"]
+
+    assert sorted(chunk["entity"] for chunk in delta["added"]) == ["Drug 2", "Drug 9"]
+    assert [entry["record"] for entry in delta["changed"]] == ["drugs.json#Drug 2"]
+    assert sorted(delta["removed"]) == sorted(
+        first["records"]["drugs.json#Drug 2"]["chunk_ids"] + first["records"]["drugs.json#Drug 4"]["chunk_ids"]
+    )
+
+
+def test_record_keys_fall_back_to_content_hash_and_number_repeats():
+    occurrences = {}
+    named = generate_chunks.record_key("drugs.json", drug("Aspirin", "x"), occurrences)
+    repeat = generate_chunks.record_key("drugs.json", drug("Aspirin", "y"), occurrences)
+    anonymous = generate_chunks.record_key("drugs.json", {"description": "no id"}, occurrences)
+    assert (named, repeat) == ("drugs.json#Aspirin", "drugs.json#Aspirin#2")
+    assert anonymous == f"drugs.json#{generate_chunks.record_hash({'description': 'no id'})}"
@@ -0,0 +1,40 @@
+import json
+
+import numpy as np
+
+import vector_store
+from chunk_schema import make_chunk
+from chunk_text_store import ChunkTextStore
+from vector_store import LocalVectorStore
+
+
+def write_corpus(tmp_path, count=6):
+    chunks = [make_chunk(f"chunk text {i}", source="test.json", entity=f"Entity {i}", sections=["overview"])
+              for i in range(count)]
+    chunks_path = tmp_path / "corpus_chunks.jsonl"
+    chunks_path.write_text("".join(json.dumps(chunk) + "\n" for chunk in chunks), encoding="utf-8")
+    embeddings = np.eye(count, 8, dtype=np.float32)
+    embeddings_path = tmp_path / "embeddings.npy"
+    np.save(embeddings_path, embeddings)
+    return chunks, str(chunks_path), str(embeddings_path)
+
+
+def test_serves_texts_from_chunk_file_without_text_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "open_text_store", lambda: None)
+    chunks, chunks_path, embeddings_path = write_corpus(tmp_path)
+
+    store = LocalVectorStore(chunks_path, embeddings_path, search_mode="exact")
+
+    documents = store.similarity_search_by_vector(store.embeddings[2], k=1)
+    assert documents[0].page_content == chunks[2]["text"]
+
+
+def test_keeps_only_texts_missing_from_store_in_memory(tmp_path):
+    chunks, chunks_path, embeddings_path = write_corpus(tmp_path)
+    text_store = ChunkTextStore(str(tmp_path / "texts.sqlite"))
+    text_store.put_many((chunk["id"], chunk["text"]) for chunk in chunks[:4])
+
+    store = LocalVectorStore(chunks_path, embeddings_path, search_mode="exact", text_store=text_store)
+
+    assert set(store.local_texts) == {chunks[4]["id"], chunks[5]["id"]}
+    assert store.texts(range(6)) == [chunk["text"] for chunk in chunks]
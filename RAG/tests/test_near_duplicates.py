@@ -0,0 +1,19 @@
+from near_duplicates import MinHasher, NearDuplicateIndex
+
+BOILERPLATE = "Take one tablet by mouth twice daily with food and do not exceed the stated dose. " * 8
+
+
+def test_merges_near_duplicates_of_one_entity():
+    hasher = MinHasher()
+    index = NearDuplicateIndex(threshold=0.9)
+    assert index.add("a", hasher.signature("Drug Name: Alpha. " + BOILERPLATE), "Alpha") == ("a", 1.0)
+    representative, similarity = index.add("b", hasher.signature("Drug Name: Alpha. " + BOILERPLATE + " Store cool."), "Alpha")
+    assert representative == "a" and similarity >= 0.9
+
+
+def test_never_merges_across_entities():
+    hasher = MinHasher()
+    index = NearDuplicateIndex(threshold=0.9)
+    index.add("a", hasher.signature("Drug Name: Alpha. " + BOILERPLATE), "Alpha")
+    assert index.add("b", hasher.signature("Drug Name: Beta. " + BOILERPLATE), "Beta") == ("b", 1.0)
+    assert index.merged == 0
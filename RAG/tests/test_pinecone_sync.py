@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+import pytest
+
+import pinecone_sync
+from chunk_schema import make_chunk
+from embedding_artifacts import EmbeddingArtifact, write_artifact
+from pinecone_sync import InMemoryIndex, sync_index
+
+
+def chunk_metadata(chunk):
+    return {field: chunk[field] for field in ("source", "entity", "sections") if chunk.get(field) is not None}
+
+
+def write_corpus(tmp_path, chunks, name="corpus"):
+    chunks_path = tmp_path / f"{name}_chunks.jsonl"
+    chunks_path.write_text("".join(json.dumps(chunk) + "\n" for chunk in chunks), encoding="utf-8")
+    rows = {chunk["id"]: np.full(4, i, dtype=np.float32) for i, chunk in enumerate(chunks)}
+    manifest = write_artifact(
+        str(tmp_path / name), [chunk["id"] for chunk in chunks], lambda ids: np.stack([rows[cid] for cid in ids]),
+        "test-model", "rev1", str(chunks_path), shard_rows=3
+    )
+    return EmbeddingArtifact(manifest), str(chunks_path)
+
+
+def make_chunks(count, sections=("overview",)):
+    return [make_chunk(f"chunk text {i}", source="test.json", entity=f"Entity {i}", sections=list(sections))
+            for i in range(count)]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(pinecone_sync.time, "sleep", lambda seconds: None)
+
+
+def sync(index, artifact, chunks_path, state_path, **kwargs):
+    return sync_index(index, artifact, chunks_path, chunk_metadata, state_path=str(state_path),
+                      batch_size=2, concurrency=2, **kwargs)
+
+
+def test_upserts_missing_and_deletes_stale(tmp_path):
+    artifact, chunks_path = write_corpus(tmp_path, make_chunks(7))
+    index = InMemoryIndex()
+    index.vectors["stale"] = ([0.0] * 4, {})
+
+    summary = sync(index, artifact, chunks_path, tmp_path / "state.json")
+
+    assert summary["upserted"] == 7 and summary["deleted"] == 1
+    assert set(index.vectors) == set(artifact.chunk_ids)
+    values, metadata = index.vectors[artifact.chunk_ids[3]]
+    assert values == [3.0] * 4 and metadata["entity"] == "Entity 3"
+
+
+def test_resync_is_idempotent(tmp_path):
+    artifact, chunks_path = write_corpus(tmp_path, make_chunks(7))
+    index = InMemoryIndex()
+    sync(index, artifact, chunks_path, tmp_path / "state.json")
+    calls = index.calls
+
+    summary = sync(index, artifact, chunks_path, tmp_path / "state.json")
+
+    assert summary["upserted"] == 0 and summary["deleted"] == 0 and summary["unchanged"] == 7
+    assert index.calls == calls
+
+
+def test_metadata_change_resends_same_text(tmp_path):
+    index = InMemoryIndex()
+    artifact, chunks_path = write_corpus(tmp_path, make_chunks(5), "v1")
+    sync(index, artifact, chunks_path, tmp_path / "state.json")
+
+    changed = make_chunks(5)
+    changed[2]["sections"] = ["treatment"]
+    artifact, chunks_path = write_corpus(tmp_path, changed, "v2")
+    summary = sync(index, artifact, chunks_path, tmp_path / "state.json")
+
+    assert summary["upserted"] == 1 and summary["metadata_changed"] == 1
+    assert index.vectors[changed[2]["id"]][1]["sections"] == ["treatment"]
+
+
+def test_state_version_tracks_content_not_count(tmp_path):
+    index = InMemoryIndex()
+    state_path = tmp_path / "state.json"
+    artifact, chunks_path = write_corpus(tmp_path, make_chunks(5), "v1")
+    sync(index, artifact, chunks_path, state_path)
+    first = json.loads(state_path.read_text())["version"]
+
+    sync(index, artifact, chunks_path, state_path)
+    assert json.loads(state_path.read_text())["version"] == first
+
+    changed = make_chunks(5)
+    changed[0] = make_chunk("replacement text", source="test.json", entity="Entity 0", sections=["overview"])
+    artifact, chunks_path = write_corpus(tmp_path, changed, "v2")
+    sync(index, artifact, chunks_path, state_path)
+    assert len(index.vectors) == 5
+    assert json.loads(state_path.read_text())["version"] != first
+
+
+def test_retries_transient_failures(tmp_path):
+    artifact, chunks_path = write_corpus(tmp_path, make_chunks(9))
+    index = InMemoryIndex(fail_every=3)
+    index.vectors["stale"] = ([0.0] * 4, {})
+
+    summary = sync(index, artifact, chunks_path, tmp_path / "state.json")
+
+    assert summary["failed_batches"] == 0
+    assert set(index.vectors) == set(artifact.chunk_ids)
+
+
+def test_persistent_failure_keeps_stale_ids_and_state(tmp_path):
+    artifact, chunks_path = write_corpus(tmp_path, make_chunks(4))
+    index = InMemoryIndex(fail_every=1)
+    index.vectors["stale"] = ([0.0] * 4, {})
+    state_path = tmp_path / "state.json"
+
+    with pytest.raises(RuntimeError):
+        sync(index, artifact, chunks_path, state_path)
+
+    assert "stale" in index.vectors
+    assert not state_path.exists()
@@ -0,0 +1,33 @@
+import asyncio
+
+import rate_limiter
+from rate_limiter import InMemoryBucketStore
+
+
+def test_idle_buckets_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    store = InMemoryBucketStore()
+
+    for i in range(100):
+        asyncio.run(store.take(f"client-{i}", 5, 1.0))
+    assert len(store._buckets) == 100
+
+    now[0] += 6  # every bucket has refilled
+    allowed, _ = asyncio.run(store.take("client-0", 5, 1.0))
+    assert allowed and list(store._buckets) == ["client-0"]
+
+
+def test_eviction_keeps_recently_used_buckets(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    store = InMemoryBucketStore()
+    asyncio.run(store.take("idle", 5, 1.0))
+    for _ in range(5):
+        asyncio.run(store.take("busy", 5, 1.0))
+
+    now[0] += 4
+    asyncio.run(store.take("busy", 5, 1.0))
+    now[0] += 2  # past the sweep interval; "busy" was used 2s ago
+    asyncio.run(store.take("other", 5, 1.0))
+    assert set(store._buckets) == {"busy", "other"}
@@ -0,0 +1,58 @@
+import io
+import json
+import gzip
+
+import pytest
+
+from source_reader import iter_json_array, iter_records
+
+
+def parse(text, buffer_size, path=()):
+    return list(iter_json_array(io.StringIO(text), buffer_size=buffer_size, path=path))
+
+
+@pytest.mark.parametrize("text", [
+    "[1.5]",
+    "[123, -4.25e-3, 0, 1E+2]",
+    '["plain", "split across reads"]',
+    r'["quote \" inside", "back\\slash", "é😀", "tab\tnewline\n"]',
+    '[{"name": "Asthma", "values": [1, 2.5, null]}, true, false, null]',
+    " [ 1 ,\n 2 ] ",
+    "[]",
+])
+@pytest.mark.parametrize("buffer_size", [1, 2, 3, 5, 7, 64])
+def test_elements_split_across_buffer_boundaries(text, buffer_size):
+    assert parse(text, buffer_size) == json.loads(text)
+
+
+@pytest.mark.parametrize("buffer_size", [1, 3, 16])
+def test_array_inside_object_dump(buffer_size):
+    text = '{"meta": {"results": {"skip": 1}, "total": 2}, "results": [{"name": "a"}, 2.75]}'
+    assert parse(text, buffer_size, path=("results",)) == [{"name": "a"}, 2.75]
+
+
+def test_top_level_array_ignores_path():
+    assert parse("[1, 2]", 4, path=("results",)) == [1, 2]
+
+
+@pytest.mark.parametrize("text", ["[1 x]", "[1.]", "[1,", '{"meta": {}}'])
+def test_malformed_input_raises(text):
+    with pytest.raises(ValueError):
+        parse(text, 2, path=("results",))
+
+
+def test_object_without_path_raises():
+    with pytest.raises(ValueError):
+        parse('{"results": []}', 4)
+
+
+def test_iter_records_reads_gzip_and_jsonl(tmp_path):
+    records = [{"name": "a", "description": "x"}, {"name": "b", "description": "y"}]
+    json_gz = tmp_path / "dump.json.gz"
+    with gzip.open(json_gz, "wt", encoding="utf-8") as f:
+        json.dump({"meta": {}, "results": records}, f)
+    jsonl = tmp_path / "dump.jsonl"
+    jsonl.write_text("\n".join(json.dumps(r) for r in records) + "\n", encoding="utf-8")
+
+    assert list(iter_records(str(json_gz))) == records
+    assert list(iter_records(str(jsonl))) == records